@@ -1,8 +1,23 @@
 from flask import Flask
 from flask_login import LoginManager
-from models import db, User, Pharmacy  # Add Pharmacy import
+from models import (
+    db, Pharmacy, recompute_doctor_ratings, backfill_availability_minutes, overlapping_availabilities
+)
 from config import Config
+from search import install_search_indexes
+from doctor_search import install_doctor_search, rebuild_doctor_search
+import query_budget
+import engine_tuning
+import metrics
+from slowlog import slow_query_log
+from stock_import import FORMATS, detect_format, import_stock
+from cache import cache
+from storage import storage
+from passwords import password_hasher
+from identity import load_identity
 import os  # Import os module
+import time
+import click
 
 
 # Initialize extensions
@@ -15,7 +30,7 @@ login_manager.login_message_category = 'info'
 @login_manager.user_loader
 def load_user(user_id):
     """Load user by ID for Flask-Login"""
-    return User.query.get(int(user_id))
+    return load_identity(int(user_id))
 
 
 def create_app(config_class=Config):
@@ -28,18 +43,80 @@ def create_app(config_class=Config):
     
     # Initialize extensions with app
     db.init_app(app)
+    engine_tuning.init_app(app)
     login_manager.init_app(app)
-    
-    # Add Pharmacy to Jinja globals for template access
-    app.jinja_env.globals['Pharmacy'] = Pharmacy
+    query_budget.init_app(app)
+    metrics.init_app(app)
+    slow_query_log.init_app(app)
+    cache.init_app(app)
+    storage.init_app(app)
+    password_hasher.init_app(app)
     
     # Register blueprints
     from routes import bp as routes_bp
     app.register_blueprint(routes_bp)
     
+    @app.cli.command('recompute-ratings')
+    def recompute_ratings_command():
+        """Rebuild every doctor's rating aggregates from the reviews table"""
+        rated = recompute_doctor_ratings()
+        db.session.commit()
+        print(f'Recomputed ratings ({rated} doctors with reviews).')
+    
+    @app.cli.command('reindex-doctors')
+    def reindex_doctors_command():
+        """Rebuild the doctor full-text search index"""
+        rebuild_doctor_search()
+        db.session.commit()
+        print('Rebuilt the doctor search index.')
+    
+    @app.cli.command('backfill-availability')
+    def backfill_availability_command():
+        """Fill the minute-of-week columns of older availability rows and report overlaps"""
+        filled, invalid = backfill_availability_minutes()
+        db.session.commit()
+        print(f'Backfilled {filled} availability slots.')
+        if invalid:
+            print(f"Skipped {len(invalid)} slots with an unknown day: ids {', '.join(map(str, invalid))}")
+        overlaps = overlapping_availabilities()
+        for doctor_id, first_id, second_id in overlaps:
+            print(f'  doctor {doctor_id}: slots {first_id} and {second_id} overlap')
+        if overlaps or invalid:
+            raise click.ClickException(f'{len(overlaps)} overlapping pairs and {len(invalid)} unusable slots; '
+                                       f'fix or delete them so availability checks stay correct')
+    
+    @app.cli.command('import-stock')
+    @click.argument('pharmacy_id', type=int)
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--format', 'fmt', type=click.Choice(FORMATS), help='Defaults to the file extension')
+    @click.option('--chunk-size', type=int, help='Rows per transaction')
+    def import_stock_command(pharmacy_id, path, fmt, chunk_size):
+        """Bulk upsert a pharmacy's stock from a CSV or JSON-lines file"""
+        fmt = fmt or detect_format(path)
+        if fmt is None:
+            raise click.UsageError('Cannot tell the file format; pass --format')
+        if db.session.get(Pharmacy, pharmacy_id) is None:
+            raise click.UsageError(f'No pharmacy with id {pharmacy_id}')
+        
+        started = time.perf_counter()
+        with open(path, encoding='utf-8-sig', newline='') as stream:
+            report = import_stock(pharmacy_id, stream, fmt, chunk_size)
+        elapsed = time.perf_counter() - started
+        
+        rows = report['inserted'] + report['updated'] + report['unchanged']
+        print(f"Inserted {report['inserted']}, updated {report['updated']}, unchanged {report['unchanged']}, "
+              f"rejected {report['rejected']} ({report['medicines_created']} new medicines) "
+              f"in {elapsed:.2f}s ({rows / elapsed if elapsed else 0:.0f} rows/s)")
+        for error in report['errors']:
+            print(f"  line {error['line']}: {error['error']}")
+        if 'error' in report:
+            raise click.ClickException(report['error'])
+    
     # Create tables
     with app.app_context():
         db.create_all()
+        install_search_indexes(app)
+        install_doctor_search(app)
     
     return app
 
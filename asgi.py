@@ -0,0 +1,8 @@
+# asgi.py
+# Optional async entry point for the read-heavy JSON APIs listed in ASGI_PATHS, e.g.
+#   uvicorn asgi:app --port 8001
+# next to gunicorn serving wsgi:app for everything else.
+from app import create_app
+from async_api import AsyncAPI
+
+app = AsyncAPI(create_app())
@@ -0,0 +1,118 @@
+"""
+ASGI adapter serving selected Flask views from an event loop.
+
+Requests wait as coroutines; only their views run, on a pool of
+ASGI_DB_THREADS threads sharing the app's models, config, caches and
+connection pool. A slow database then holds one of a fixed number of threads
+instead of one gunicorn worker (or thread) per request, so thousands of
+pending requests cost little more memory than a few.
+"""
+import asyncio
+import io
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.test import run_wsgi_app
+
+
+def _environ(scope, body):
+    """WSGI environ for an ASGI HTTP scope"""
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'],
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': scope['client'][0] if scope.get('client') else '',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        key = name.decode('latin-1').upper().replace('-', '_')
+        if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            key = f'HTTP_{key}'
+        value = value.decode('latin-1')
+        if key in environ:
+            # Repeated headers are one comma-separated value in WSGI; cookies use '; '
+            value = environ[key] + ('; ' if key == 'HTTP_COOKIE' else ', ') + value
+        environ[key] = value
+    environ['CONTENT_LENGTH'] = str(len(body))  # The body is already buffered, even if it came chunked
+    return environ
+
+
+class AsyncAPI:
+    """ASGI application running the Flask views for ASGI_PATHS on a bounded thread pool"""
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.paths = flask_app.config['ASGI_PATHS']
+        self.max_body = flask_app.config['MAX_CONTENT_LENGTH']
+        self.executor = ThreadPoolExecutor(max_workers=flask_app.config['ASGI_DB_THREADS'],
+                                           thread_name_prefix='asgi-db')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _http(self, scope, receive, send):
+        if scope['path'] not in self.paths.get(scope['method'], ()):
+            await self._send(send, 404, [(b'content-type', b'application/json')],
+                             json.dumps({'error': 'Not served by the async API.'}).encode())
+            return
+
+        body = bytearray()
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body += message.get('body', b'')
+            if self.max_body and len(body) > self.max_body:
+                await self._send(send, 413, [(b'content-type', b'application/json')],
+                                 json.dumps({'error': 'Request body too large.'}).encode())
+                return
+            if not message.get('more_body'):
+                break
+
+        environ = _environ(scope, bytes(body))
+        status, headers, payload = await asyncio.get_running_loop().run_in_executor(
+            self.executor, self._dispatch, environ
+        )
+        await self._send(send, status, headers, payload)
+
+    def _dispatch(self, environ):
+        """Run the Flask app for one request on a pool thread (own app context and DB session)"""
+        app_iter, status, headers = run_wsgi_app(self.flask_app, environ, buffered=True)
+        try:
+            payload = b''.join(app_iter)
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+        return (int(status.split(' ', 1)[0]),
+                [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers.items()],
+                payload)
+
+    @staticmethod
+    async def _send(send, status, headers, payload):
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': payload})
+
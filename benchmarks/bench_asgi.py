@@ -0,0 +1,231 @@
+"""
+Async API benchmark: concurrency at fixed memory, ASGI (asgi.py) vs the WSGI path (wsgi.py).
+
+Seeds a temporary SQLite database (seed.py --scale) and adds --db-latency-ms
+to every statement to stand in for a networked database. For each
+--concurrency level, a fresh process keeps that many requests in flight
+against /api/doctors, /api/specialties and /api/search-medicines:
+
+- wsgi: one thread per in-flight request, as a threaded gunicorn worker
+  needs to hold that many requests at once;
+- asgi: one coroutine per in-flight request, with the views run on the
+  AsyncAPI pool of --threads threads.
+
+Caches and search coalescing are off so every request reaches the database.
+Reported memory is the process's peak RSS growth while the load ran.
+
+Usage: python benchmarks/bench_asgi.py [--size 2000] [--requests 2000] [--concurrency 10,100,500]
+                                       [--threads 8] [--db-latency-ms 2]
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event, select  # noqa: E402
+from werkzeug.test import EnvironBuilder, run_wsgi_app  # noqa: E402
+from app import create_app  # noqa: E402
+from async_api import AsyncAPI  # noqa: E402
+from config import Config  # noqa: E402
+from models import db, DoctorProfile, Medicine  # noqa: E402
+from seed import seed_scaled  # noqa: E402
+
+
+def bench_config(url, threads):
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = url
+        SQL_QUERY_BUDGET = None
+        SQL_QUERY_BUDGETS = {}
+        CACHE_BACKEND = 'null'
+        SEARCH_COALESCE_CELL_DEGREES = None
+        ASGI_DB_THREADS = threads
+        # Let the WSGI threads queue for connections instead of failing
+        SQLALCHEMY_ENGINE_OPTIONS = {'pool_size': threads, 'max_overflow': 0, 'pool_timeout': 300}
+    return BenchConfig
+
+
+def memory_kb():
+    """(current, peak) resident set size of this process in kB"""
+    values = {}
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith(('VmRSS:', 'VmHWM:')):
+                name, value = line.split(':')
+                values[name] = int(value.split()[0])
+    return values['VmRSS'], values['VmHWM']
+
+
+def request_mix(fixtures, count, seed):
+    """(method, path, query string, JSON body) for `count` requests"""
+    rng = random.Random(seed)
+    requests = []
+    for i in range(count):
+        kind = i % 3
+        if kind == 0:
+            requests.append(('GET', '/api/doctors', f"specialty={rng.choice(fixtures['specialties'])}", None))
+        elif kind == 1:
+            requests.append(('GET', '/api/specialties', '', None))
+        else:
+            requests.append(('POST', '/api/search-medicines', '', {
+                'medicine_name': rng.choice(fixtures['medicine_names']),
+                'lat': rng.uniform(33.5, 37.3), 'lng': rng.uniform(8.0, 11.1)
+            }))
+    return requests
+
+
+def run_wsgi(flask_app, requests, concurrency):
+    """Thread per in-flight request; returns (latencies, errors)"""
+    pending = iter(requests)
+    lock = threading.Lock()
+    latencies, errors = [], [0]
+
+    def worker():
+        while True:
+            with lock:
+                item = next(pending, None)
+            if item is None:
+                return
+            method, path, query, body = item
+            environ = EnvironBuilder(path=path, method=method, query_string=query, json=body).get_environ()
+            started = perf_counter()
+            app_iter, status, _ = run_wsgi_app(flask_app, environ, buffered=True)
+            b''.join(app_iter)
+            elapsed = perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                if not status.startswith(('200', '404')):
+                    errors[0] += 1
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors[0]
+
+
+def run_asgi(asgi_app, requests, concurrency):
+    """Coroutine per in-flight request; returns (latencies, errors)"""
+    latencies, errors = [], [0]
+
+    async def call(method, path, query, body):
+        payload = json.dumps(body).encode() if body is not None else b''
+        headers = [(b'content-type', b'application/json')] if body is not None else []
+        scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query.encode(),
+                 'headers': headers, 'http_version': '1.1', 'scheme': 'http', 'server': ('bench', 80)}
+        received = False
+        status = []
+
+        async def receive():
+            nonlocal received
+            if received:
+                await asyncio.Event().wait()  # No disconnect before the response
+            received = True
+            return {'type': 'http.request', 'body': payload, 'more_body': False}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+
+        await asgi_app(scope, receive, send)
+        return status[0]
+
+    async def worker(pending):
+        for method, path, query, body in pending:
+            started = perf_counter()
+            status = await call(method, path, query, body)
+            latencies.append(perf_counter() - started)
+            if status not in (200, 404):
+                errors[0] += 1
+
+    async def main():
+        pending = iter(requests)
+        await asyncio.gather(*[worker(pending) for _ in range(concurrency)])
+
+    asyncio.run(main())
+    return latencies, errors[0]
+
+
+def measure(mode, url, args, requests, concurrency, results):
+    flask_app = create_app(bench_config(url, args.threads))
+    with flask_app.app_context():
+        engine = db.engine
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _network_latency(*_):
+        time.sleep(args.db_latency_ms / 1000)
+
+    # Warm up the in-process indexes so their one-off build isn't measured
+    warm = requests[:6]
+    if mode == 'wsgi':
+        run_wsgi(flask_app, warm, 1)
+    else:
+        asgi_app = AsyncAPI(flask_app)
+        run_asgi(asgi_app, warm, 1)
+
+    rss_before, _ = memory_kb()
+    started = perf_counter()
+    if mode == 'wsgi':
+        latencies, errors = run_wsgi(flask_app, requests, concurrency)
+    else:
+        latencies, errors = run_asgi(asgi_app, requests, concurrency)
+    elapsed = perf_counter() - started
+    _, peak = memory_kb()
+
+    latencies.sort()
+    results.put({
+        'throughput': len(latencies) / elapsed,
+        'p95_ms': latencies[int(len(latencies) * 0.95)] * 1000 if latencies else float('nan'),
+        'memory_mb': (peak - rss_before) / 1024,
+        'threads': concurrency if mode == 'wsgi' else args.threads,
+        'errors': errors
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', type=int, default=2000, help='Users to seed')
+    parser.add_argument('--requests', type=int, default=2000, help='Requests per run')
+    parser.add_argument('--concurrency', default='10,100,500', help='In-flight request levels')
+    parser.add_argument('--threads', type=int, default=8, help='AsyncAPI pool size (and DB connections)')
+    parser.add_argument('--db-latency-ms', type=float, default=2.0, help='Simulated network time per SQL statement')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        url = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+        seeding_app = create_app(bench_config(url, args.threads))
+        seed_scaled(args.size, seeding_app)
+        with seeding_app.app_context():
+            fixtures = {
+                'specialties': db.session.scalars(select(DoctorProfile.specialty).distinct()).all(),
+                'medicine_names': db.session.scalars(select(Medicine.name).limit(200)).all()
+            }
+            db.engine.dispose()
+        requests = request_mix(fixtures, args.requests, seed=1)
+
+        print(f'\n{args.requests} requests per run, {args.db_latency_ms:g} ms per statement, '
+              f'ASGI pool of {args.threads} threads')
+        print(f"{'mode':>5} {'in flight':>10} {'threads':>8} {'req/s':>8} {'p95 ms':>8} {'peak MB':>8} {'errors':>7}")
+        context = multiprocessing.get_context('fork')
+        for concurrency in [int(level) for level in args.concurrency.split(',')]:
+            for mode in ('wsgi', 'asgi'):
+                results = context.Queue()
+                process = context.Process(target=measure, args=(mode, url, args, requests, concurrency, results))
+                process.start()
+                row = results.get()
+                process.join()
+                print(f"{mode:>5} {concurrency:>10} {row['threads']:>8} {row['throughput']:>8.0f} "
+                      f"{row['p95_ms']:>8.1f} {row['memory_mb']:>8.1f} {row['errors']:>7}")
+
+
+if __name__ == '__main__':
+    main()
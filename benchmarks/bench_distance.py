@@ -0,0 +1,65 @@
+"""
+Micro-benchmark: scalar haversine + full sort vs. batched haversine + top-k.
+
+Usage: python benchmarks/bench_distance.py [--k 10] [--repeat 5]
+"""
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import distance  # noqa: E402
+from distance import haversine_distance, rank_by_distance  # noqa: E402
+
+SIZES = [1_000, 10_000, 100_000]
+
+
+def scalar_rank(lat, lng, ids, lats, lngs, k):
+    """The pre-vectorization path: one math call per pharmacy, then a full sort"""
+    results = [(haversine_distance(lat, lng, plat, plng), pid) for pid, plat, plng in zip(ids, lats, lngs)]
+    results.sort()
+    return results[:k]
+
+
+def best_time(fn, repeat):
+    return min(timeit.repeat(fn, number=1, repeat=repeat)) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    numpy = distance.np
+    print(f"NumPy: {numpy.__version__ if numpy is not None else 'not installed'}")
+    print(f"{'pharmacies':>10} {'scalar ms':>10} {'batch ms':>10} {'array ms':>10} {'speedup':>8}")
+
+    for size in SIZES:
+        ids = list(range(size))
+        lats = [rng.uniform(30.0, 37.5) for _ in ids]
+        lngs = [rng.uniform(7.5, 11.5) for _ in ids]
+        lat, lng = 36.8065, 10.1815
+
+        expected = [pid for _, pid in scalar_rank(lat, lng, ids, lats, lngs, args.k)]
+        assert [pid for _, pid in rank_by_distance(lat, lng, ids, lats, lngs, args.k)] == expected
+
+        scalar = best_time(lambda: scalar_rank(lat, lng, ids, lats, lngs, args.k), args.repeat)
+        batch = best_time(lambda: rank_by_distance(lat, lng, ids, lats, lngs, args.k), args.repeat)
+
+        # Same batch path with NumPy disabled, to measure the array-module fallback
+        distance.np = None
+        try:
+            fallback = best_time(lambda: rank_by_distance(lat, lng, ids, lats, lngs, args.k), args.repeat)
+        finally:
+            distance.np = numpy
+
+        print(f"{size:>10} {scalar:>10.2f} {batch:>10.2f} {fallback:>10.2f} {scalar / batch:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
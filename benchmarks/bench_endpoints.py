@@ -0,0 +1,291 @@
+"""
+Endpoint benchmark: latency percentiles, throughput and SQL statements per request.
+
+Seeds a deterministic dataset (seed.py --scale) at each size in a temporary
+SQLite database and drives the app through the Flask test client. With --url
+it drives an already running server (e.g. gunicorn) instead; fixture ids are
+then read through DATABASE_URL, which must point at that server's database
+seeded with `python seed.py --scale N`.
+
+Usage:
+    python benchmarks/bench_endpoints.py [--sizes 1000,10000] [--requests 200] [--output report.json]
+    python benchmarks/bench_endpoints.py --baseline baseline.json   # exits 1 on regressions
+    python benchmarks/bench_endpoints.py --url http://127.0.0.1:8000
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import sys
+import tempfile
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime
+from http.cookiejar import CookieJar
+from json import dumps as json_dumps
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sqlalchemy  # noqa: E402
+from faker import Faker  # noqa: E402
+from sqlalchemy import select  # noqa: E402
+from app import create_app  # noqa: E402
+from config import Config  # noqa: E402
+from models import db, User, DoctorProfile, Medicine, Review  # noqa: E402
+from search import medicine_index  # noqa: E402
+from spatial import pharmacy_index  # noqa: E402
+from stock_index import stock_index  # noqa: E402
+from seed import seed_scaled  # noqa: E402
+
+PASSWORD = 'password123'  # Shared by every user seed.py creates
+
+
+class HTTPResponse:
+    def __init__(self, status_code, headers):
+        self.status_code = status_code
+        self.headers = headers
+
+
+class HTTPClient:
+    """Just enough of the Flask test client interface to drive a live server"""
+
+    class _NoRedirect(urllib.request.HTTPRedirectHandler):
+        def redirect_request(self, *args, **kwargs):
+            return None
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(CookieJar()), self._NoRedirect)
+
+    def open(self, path, method='GET', data=None, json=None):
+        headers, body = {}, None
+        if json is not None:
+            body, headers['Content-Type'] = json_dumps(json).encode(), 'application/json'
+        elif data is not None:
+            body, headers['Content-Type'] = urllib.parse.urlencode(data).encode(), 'application/x-www-form-urlencoded'
+        request = urllib.request.Request(self.base_url + path, data=body, headers=headers, method=method)
+        try:
+            with self.opener.open(request) as response:
+                response.read()
+                return HTTPResponse(response.status, response.headers)
+        except urllib.error.HTTPError as error:
+            error.read()
+            return HTTPResponse(error.code, error.headers)
+
+
+class BenchConfig(Config):
+    TESTING = True  # Makes the app report X-SQL-Queries
+    SQL_QUERY_BUDGET = None
+    SQL_QUERY_BUDGETS = {}
+
+
+def load_fixtures():
+    """Ids and credentials the scenarios draw from, read from the seeded database"""
+    def first_email(role):
+        return db.session.scalar(select(User.email).where(User.role == role).order_by(User.id).limit(1))
+
+    patient_email = first_email('patient')
+    patient_id = db.session.scalar(select(User.id).where(User.email == patient_email))
+    reviewed = set(db.session.scalars(select(Review.doctor_id).where(Review.patient_id == patient_id)))
+    doctor_ids = db.session.scalars(select(DoctorProfile.id).order_by(DoctorProfile.id)).all()
+    return {
+        'doctor_ids': doctor_ids[:1000],
+        'unreviewed_doctor_ids': [doctor_id for doctor_id in doctor_ids if doctor_id not in reviewed],
+        'specialties': db.session.scalars(select(DoctorProfile.specialty).distinct()).all(),
+        'medicine_names': db.session.scalars(select(Medicine.name).order_by(Medicine.id).limit(500)).all(),
+        'patient_email': patient_email,
+        'admin_email': first_email('admin')
+    }
+
+
+def build_scenarios(new_client, fixtures, rng):
+    """Map scenario name -> zero-argument callable issuing one request (None when exhausted)"""
+    def logged_in(email):
+        client = new_client()
+        response = client.open('/login', method='POST', data={'email': email, 'password': PASSWORD})
+        if response.status_code != 302:
+            raise RuntimeError(f'Could not log in as {email}')
+        return client
+
+    anonymous = new_client()
+    patient = logged_in(fixtures['patient_email'])
+    admin = logged_in(fixtures['admin_email'])
+    unreviewed = iter(fixtures['unreviewed_doctor_ids'])
+
+    def search_medicines():
+        name = rng.choice(fixtures['medicine_names'])
+        return anonymous.open('/api/search-medicines', method='POST', json={
+            'medicine_name': name[:rng.randint(3, len(name))],
+            'lat': rng.uniform(33.5, 37.3), 'lng': rng.uniform(8.0, 11.1)
+        })
+
+    def api_doctors():
+        return anonymous.open(f"/api/doctors?specialty={rng.choice(fixtures['specialties'])}")
+
+    def submit_review():
+        doctor_id = next(unreviewed, None)
+        if doctor_id is None:
+            return None
+        return patient.open(f'/doctor/{doctor_id}/review', method='POST', data={'rating': rng.randint(1, 5), 'comment': 'Benchmark'})
+
+    return {
+        'search_medicines': search_medicines,
+        'api_doctors': api_doctors,
+        'api_specialties': lambda: anonymous.open('/api/specialties'),
+        'doctor_profile': lambda: anonymous.open(f"/doctor/{rng.choice(fixtures['doctor_ids'])}"),
+        'admin_dashboard': lambda: admin.open('/admin'),
+        'login': lambda: new_client().open('/login', method='POST', data={
+            'email': fixtures['patient_email'], 'password': PASSWORD}),
+        'submit_review': submit_review
+    }
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, math.ceil(p / 100 * len(sorted_values)) - 1)]
+
+
+def run_scenario(name, issue, requests, warmup):
+    for _ in range(warmup):
+        issue()
+
+    latencies, queries = [], []
+    started = perf_counter()
+    for _ in range(requests):
+        request_started = perf_counter()
+        response = issue()
+        if response is None:
+            break
+        latencies.append((perf_counter() - request_started) * 1000)
+        if response.status_code >= 400:
+            raise RuntimeError(f'{name} returned HTTP {response.status_code}')
+        if response.headers.get('X-SQL-Queries') is not None:
+            queries.append(int(response.headers['X-SQL-Queries']))
+    elapsed = perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'p50_ms': round(percentile(latencies, 50), 3) if latencies else None,
+        'p95_ms': round(percentile(latencies, 95), 3) if latencies else None,
+        'p99_ms': round(percentile(latencies, 99), 3) if latencies else None,
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'sql_queries_mean': round(sum(queries) / len(queries), 2) if queries else None,
+        'sql_queries_max': max(queries) if queries else None
+    }
+
+
+def run_all(new_client, fixtures, args, seed):
+    rng = random.Random(seed)
+    results = {}
+    for name, issue in build_scenarios(new_client, fixtures, rng).items():
+        results[name] = stats = run_scenario(name, issue, args.requests, args.warmup)
+        print(f"  {name:<18} {stats['p50_ms'] or 0:>8.2f} {stats['p95_ms'] or 0:>8.2f} {stats['p99_ms'] or 0:>8.2f} "
+              f"{stats['throughput_rps'] or 0:>9.1f} {stats['sql_queries_mean'] if stats['sql_queries_mean'] is not None else '-':>6}")
+    return results
+
+
+def print_header(label):
+    print(f"\n{label}")
+    print(f"  {'endpoint':<18} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'req/s':>9} {'SQL':>6}")
+
+
+def bench_test_client(args):
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            class SizedConfig(BenchConfig):
+                SQLALCHEMY_DATABASE_URI = f"sqlite:///{os.path.join(directory, f'bench_{size}.db')}"
+
+            app = create_app(SizedConfig)
+            random.seed(size)
+            Faker.seed(size)
+            seed_scaled(size, app)
+            with app.app_context():
+                # Process-wide indexes still describe the previous size's database
+                medicine_index.invalidate()
+                pharmacy_index.invalidate()
+                stock_index.invalidate()
+                fixtures = load_fixtures()
+            # Requests run outside that app context so each gets its own session and g
+            print_header(f'{size} users (Flask test client)')
+            results[str(size)] = run_all(app.test_client, fixtures, args, seed=size)
+    return results
+
+
+def bench_url(args):
+    app = create_app()
+    with app.app_context():
+        fixtures = load_fixtures()
+    print_header(f'{args.url} (live server)')
+    return {args.url: run_all(lambda: HTTPClient(args.url), fixtures, args, seed=0)}
+
+
+def compare(report, baseline, threshold):
+    """Print p95 and SQL deltas against a baseline report and return the regressions"""
+    regressions = []
+    print(f"\nAgainst baseline from {baseline['meta'].get('created_at', '?')}:")
+    for size, endpoints in report['results'].items():
+        for name, stats in endpoints.items():
+            base = baseline['results'].get(size, {}).get(name)
+            if not base or not base.get('p95_ms') or stats['p95_ms'] is None:
+                continue
+            change = stats['p95_ms'] / base['p95_ms'] - 1
+            queries, base_queries = stats['sql_queries_mean'], base.get('sql_queries_mean')
+            flags = []
+            if change > threshold:
+                flags.append(f'p95 +{change:.0%}')
+            if queries is not None and base_queries is not None and queries > base_queries:
+                flags.append(f'SQL {base_queries} -> {queries}')
+            print(f"  {size:>8} {name:<18} p95 {base['p95_ms']:>8.2f} -> {stats['p95_ms']:>8.2f} ({change:+.0%})"
+                  + (f"  REGRESSION: {', '.join(flags)}" if flags else ''))
+            if flags:
+                regressions.append((size, name, flags))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='1000,10000', type=lambda value: [int(size) for size in value.split(',')],
+                        help='Comma-separated user counts to seed (test client mode)')
+    parser.add_argument('--requests', type=int, default=200, help='Measured requests per endpoint')
+    parser.add_argument('--warmup', type=int, default=10, help='Unmeasured requests per endpoint first')
+    parser.add_argument('--url', help='Benchmark a running server instead of the test client')
+    parser.add_argument('--output', default='bench_endpoints.json', help='Where to write the JSON report')
+    parser.add_argument('--baseline', help='Earlier report to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Allowed p95 slowdown before flagging (0.2 = 20%%)')
+    args = parser.parse_args()
+
+    results = bench_url(args) if args.url else bench_test_client(args)
+    report = {
+        'meta': {
+            'created_at': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+            'python': platform.python_version(),
+            'sqlalchemy': sqlalchemy.__version__,
+            'platform': platform.platform(),
+            'mode': 'url' if args.url else 'test_client',
+            'requests': args.requests,
+            'warmup': args.warmup
+        },
+        'results': results
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'\nReport written to {args.output}')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""
+Engine profile benchmark: throughput of concurrent worker processes with and without tuning.
+
+Each profile gets a fresh database. --workers forked processes (like gunicorn
+workers) then run a read-heavy mix of doctor lookups and review writes for
+--seconds. SQLite profiles run against a temporary file; pass --url to compare
+pool settings on PostgreSQL instead.
+
+Usage: python benchmarks/bench_engine.py [--workers 4] [--seconds 5] [--write-ratio 0.2] [--url URL]
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, insert, select, func, update  # noqa: E402
+from sqlalchemy.exc import OperationalError  # noqa: E402
+from config import Config, engine_options  # noqa: E402
+from engine_tuning import tune_engine  # noqa: E402
+from models import db, User, DoctorProfile, Review  # noqa: E402
+
+USERS = 2000
+DOCTORS = 400
+
+
+def make_engine(url, tuned):
+    engine = create_engine(url, **(engine_options(url) if tuned else {}))
+    if tuned:
+        tune_engine(engine, Config.SQLITE_PRAGMAS)
+    return engine
+
+
+def prepare(url):
+    engine = create_engine(url)
+    db.metadata.drop_all(engine)
+    db.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(insert(User), [
+            {'name': f'User {i}', 'email': f'user{i}@bench.test', 'password_hash': 'x',
+             'role': 'doctor' if i < DOCTORS else 'patient', 'is_vip': False, 'balance': 0.0}
+            for i in range(USERS)])
+        connection.execute(insert(DoctorProfile), [
+            {'user_id': i + 1, 'specialty': 'Cardiology', 'average_rating': 0.0, 'rating_sum': 0, 'rating_count': 0}
+            for i in range(DOCTORS)])
+        if engine.dialect.name == 'sqlite':
+            connection.exec_driver_sql('PRAGMA journal_mode = DELETE')  # WAL persists in the file; start from the default
+    engine.dispose()
+
+
+def worker(url, tuned, seconds, write_ratio, seed, results):
+    rng = random.Random(seed)
+    engine = make_engine(url, tuned)
+    latencies, errors = [], 0
+    deadline = perf_counter() + seconds
+    while perf_counter() < deadline:
+        started = perf_counter()
+        doctor_id = rng.randint(1, DOCTORS)
+        try:
+            if rng.random() < write_ratio:
+                rating = rng.randint(1, 5)
+                with engine.begin() as connection:
+                    connection.execute(insert(Review).values(
+                        doctor_id=doctor_id, patient_id=rng.randint(DOCTORS + 1, USERS), rating=rating, comment='bench'))
+                    connection.execute(update(DoctorProfile).where(DoctorProfile.id == doctor_id).values(
+                        rating_sum=DoctorProfile.rating_sum + rating, rating_count=DoctorProfile.rating_count + 1))
+            else:
+                with engine.connect() as connection:
+                    connection.execute(select(DoctorProfile, User.name).join(User, User.id == DoctorProfile.user_id)
+                                       .where(DoctorProfile.id == doctor_id)).all()
+                    connection.execute(select(func.count(Review.id)).where(Review.doctor_id == doctor_id)).scalar()
+        except OperationalError:
+            errors += 1
+            continue
+        latencies.append(perf_counter() - started)
+    engine.dispose()
+    results.put((latencies, errors))
+
+
+def run_profile(url, tuned, args):
+    prepare(url)
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    processes = [context.Process(target=worker, args=(url, tuned, args.seconds, args.write_ratio, seed, results))
+                 for seed in range(args.workers)]
+    for process in processes:
+        process.start()
+    collected = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    latencies = sorted(latency for worker_latencies, _ in collected for latency in worker_latencies)
+    errors = sum(worker_errors for _, worker_errors in collected)
+    p95 = latencies[int(len(latencies) * 0.95)] * 1000 if latencies else float('nan')
+    return len(latencies) / args.seconds, p95, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    parser.add_argument('--url', help='Database to benchmark (default: a temporary SQLite file); it is wiped')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        url = args.url or f"sqlite:///{os.path.join(directory, 'bench.db')}"
+        print(f'{args.workers} workers, {args.seconds:g}s per profile, {args.write_ratio:.0%} writes, '
+              f"{url.split('://')[0]}")
+        print(f"{'profile':>8} {'ops/s':>10} {'p95 ms':>8} {'errors':>7}")
+        for name, tuned in (('default', False), ('tuned', True)):
+            throughput, p95, errors = run_profile(url, tuned, args)
+            print(f'{name:>8} {throughput:>10.0f} {p95:>8.2f} {errors:>7}')
+
+
+if __name__ == '__main__':
+    main()
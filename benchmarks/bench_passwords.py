@@ -0,0 +1,77 @@
+"""
+Password hashing benchmark: logins/sec per core at each hashing cost.
+
+For every method, one hash is made and then verified repeatedly for --seconds,
+first on the calling thread (one core), then from --threads concurrent callers
+through a PasswordHasher pool of --workers threads, the way a threaded
+gunicorn worker would. Per-core throughput divides by the cores the pool can
+actually use. "hash ms" is also the one-off extra cost of the first login
+after a policy change, when the stored hash is upgraded.
+
+Usage: python benchmarks/bench_passwords.py [--methods pbkdf2:sha256:600000,scrypt:32768:8:1]
+                                            [--seconds 3] [--threads 8] [--workers N]
+"""
+import argparse
+import os
+import sys
+import threading
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from passwords import PasswordHasher  # noqa: E402
+
+DEFAULT_METHODS = [
+    'pbkdf2:sha256:600000',
+    'pbkdf2:sha256:260000',
+    'pbkdf2:sha256:100000',
+    'scrypt:32768:8:1',
+    'scrypt:16384:8:1',
+]
+
+
+def verify_rate(hasher, password_hash, seconds, threads):
+    """Verifications per second from `threads` concurrent callers"""
+    counts = [0] * threads
+    deadline = perf_counter() + seconds
+
+    def caller(index):
+        while perf_counter() < deadline:
+            hasher.verify(password_hash, 'correct horse battery staple')
+            counts[index] += 1
+
+    callers = [threading.Thread(target=caller, args=(i,)) for i in range(threads)]
+    started = perf_counter()
+    for thread in callers:
+        thread.start()
+    for thread in callers:
+        thread.join()
+    return sum(counts) / (perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--methods', default=','.join(DEFAULT_METHODS))
+    parser.add_argument('--seconds', type=float, default=3)
+    parser.add_argument('--threads', type=int, default=8, help='Concurrent login requests')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Hashing pool size')
+    args = parser.parse_args()
+
+    cores = min(args.workers, os.cpu_count())
+    print(f'{os.cpu_count()} CPUs, pool of {args.workers} workers, {args.threads} concurrent logins, '
+          f'{args.seconds:g}s per measurement')
+    print(f"{'method':<24} {'hash ms':>8} {'1 core/s':>9} {'pool/s':>8} {'per core/s':>11}")
+    for method in args.methods.split(','):
+        hasher = PasswordHasher(method, workers=args.workers)
+        started = perf_counter()
+        password_hash = hasher.hash('correct horse battery staple')
+        hash_ms = (perf_counter() - started) * 1000
+
+        inline = PasswordHasher(method, workers=0)
+        single = verify_rate(inline, password_hash, args.seconds, 1)
+        pooled = verify_rate(hasher, password_hash, args.seconds, args.threads)
+        print(f'{method:<24} {hash_ms:>8.1f} {single:>9.1f} {pooled:>8.1f} {pooled / cores:>11.1f}')
+
+
+if __name__ == '__main__':
+    main()
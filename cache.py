@@ -0,0 +1,198 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+
+class NullBackend:
+    """Backend that stores nothing, for disabling the cache"""
+
+    def get(self, key):
+        return None
+
+    def set(self, key, entry):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+    def __len__(self):
+        return 0
+
+
+class LRUTTLBackend:
+    """In-process store bounded to max_entries, evicting least recently used first"""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def set(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def delete(self, key):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+BACKENDS = {
+    'lru': lambda app: LRUTTLBackend(app.config['CACHE_MAX_ENTRIES']),
+    'null': lambda app: NullBackend()
+}
+
+
+class Cache:
+    """
+    Read-through cache with per-entry TTL and tag-based invalidation.
+
+    Storage is delegated to a backend (see BACKENDS, chosen by CACHE_BACKEND).
+    Entries are usually tagged with the tables they were computed from
+    (see table_tag); committing a change to one of those tables drops them.
+    Invalidation bumps a per-tag version that entries are checked against, so
+    it is O(1) and needs no key bookkeeping that could outgrow the backend.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend or LRUTTLBackend()
+        self.default_ttl = 60
+        self._versions = {}  # tag -> version, bumped on invalidation
+        self._lock = threading.RLock()
+        self.stats = {'hits': 0, 'misses': 0, 'sets': 0, 'invalidations': 0}
+
+    def init_app(self, app):
+        self.backend = BACKENDS[app.config['CACHE_BACKEND']](app)
+        self.default_ttl = app.config['CACHE_DEFAULT_TTL']
+        self.clear()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self.backend.get(key)
+            if entry is not None and (entry[0] < time.monotonic() or self._is_stale(entry[2])):
+                self.backend.delete(key)
+                entry = None
+            if entry is None:
+                self.stats['misses'] += 1
+                return default
+            self.stats['hits'] += 1
+            return entry[1]
+
+    def set(self, key, value, ttl=None, tags=()):
+        self._store(key, value, ttl, self._snapshot(tags))
+
+    def get_or_set(self, key, factory, ttl=None, tags=()):
+        """Return the cached value for key, computing and storing it on a miss"""
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            # Snapshot tag versions first so a write during factory() still invalidates
+            versions = self._snapshot(tags)
+            value = factory()
+            self._store(key, value, ttl, versions)
+        return value
+
+    def _snapshot(self, tags):
+        with self._lock:
+            return tuple((tag, self._versions.get(tag, 0)) for tag in tags)
+
+    def _is_stale(self, versions):
+        return any(self._versions.get(tag, 0) != version for tag, version in versions)
+
+    def _store(self, key, value, ttl, versions):
+        ttl = self.default_ttl if ttl is None else ttl
+        with self._lock:
+            self.backend.set(key, (time.monotonic() + ttl, value, versions))
+            self.stats['sets'] += 1
+
+    def invalidate(self, *tags):
+        """Drop every entry carrying any of the given tags"""
+        with self._lock:
+            for tag in tags:
+                self._versions[tag] = self._versions.get(tag, 0) + 1
+                self.stats['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            self.backend.clear()
+
+    def info(self):
+        """Counters plus current size, for monitoring"""
+        with self._lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            return dict(
+                self.stats,
+                entries=len(self.backend),
+                hit_ratio=round(self.stats['hits'] / lookups, 4) if lookups else None
+            )
+
+
+def table_tag(model):
+    """Invalidation tag for a model's table"""
+    return f'table:{model.__tablename__}'
+
+
+cache = Cache()
+
+_write_tags = {}  # model class -> function(obj) returning extra tags to invalidate
+
+
+def tag_writes(model, tags_for):
+    """Also invalidate tags_for(obj) whenever an instance of model is written"""
+    _write_tags[model] = tags_for
+
+
+def cached(key, ttl=None, tags=()):
+    """
+    Cache a function's return value. `key` is a string or a callable taking
+    the function's arguments and returning one. Values must be plain data, as
+    they are shared across requests.
+    """
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            cache_key = key(*args, **kwargs) if callable(key) else key
+            return cache.get_or_set(cache_key, lambda: f(*args, **kwargs), ttl, tags)
+        return wrapper
+    return decorator
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_written_tables(session, flush_context):
+    written = session.info.setdefault('cache_written_tables', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        table = getattr(obj, '__tablename__', None)
+        if table:
+            written.add(f'table:{table}')
+        tags_for = _write_tags.get(type(obj))
+        if tags_for:
+            written.update(tags_for(obj))
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_written_tables(session):
+    written = session.info.pop('cache_written_tables', None)
+    if written:
+        cache.invalidate(*written)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_written_tables(session):
+    session.info.pop('cache_written_tables', None)
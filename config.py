@@ -3,6 +3,22 @@ from datetime import timedelta
 
 basedir = os.path.abspath(os.path.dirname(__file__))
 
+# Set DB_TUNING=0 to fall back to driver defaults (e.g. to benchmark against them)
+DB_TUNING = os.environ.get('DB_TUNING', '1') != '0'
+
+
+def engine_options(uri):
+    """SQLALCHEMY_ENGINE_OPTIONS profile for the database at uri"""
+    if not DB_TUNING or not uri or not uri.startswith('postgresql'):
+        return {}  # SQLite tuning happens per connection, see SQLITE_PRAGMAS
+    return {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),  # Per worker process
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': 10,  # Fail fast instead of queueing requests behind a saturated pool
+        'pool_pre_ping': True,  # Replace connections dropped by the server or a proxy
+        'pool_recycle': 1800  # Retire connections before server/proxy idle timeouts
+    }
+
 
 class Config:
     """Application configuration"""
@@ -13,16 +29,103 @@ class Config:
     if 'postgres' in db_uri:
         db_uri = 'postgresql+pg8000://' + db_uri.split('://', 1)[1]
     SQLALCHEMY_DATABASE_URI = db_uri
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(db_uri)
+    
+    # Applied to every new SQLite connection: WAL lets readers proceed while one worker writes,
+    # and busy_timeout makes concurrent writers wait instead of failing with "database is locked"
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',  # Safe with WAL; only the last commits can be lost on power failure
+        'busy_timeout': 5000,
+        'cache_size': -64000,  # 64MB page cache per connection
+        'mmap_size': 268435456  # 256MB memory-mapped reads
+    } if DB_TUNING else {}
     
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
     # File upload configuration
-    UPLOAD_FOLDER = os.path.join(basedir, 'static/uploads')
+    UPLOAD_FOLDER = os.path.join(basedir, 'static/uploads')  # Files uploaded before UPLOAD_STORAGE_DIR
+    UPLOAD_STORAGE_BACKEND = 'local'  # Content-addressed by SHA-256, see storage.BACKENDS
+    UPLOAD_STORAGE_DIR = os.environ.get('UPLOAD_STORAGE_DIR') or os.path.join(basedir, 'uploads')
+    # Let the front-end server send consult files: 'x-sendfile' (Apache, lighttpd) or
+    # 'x-accel-redirect' (nginx, with an internal location at UPLOAD_ACCEL_REDIRECT_PREFIX
+    # aliased to UPLOAD_STORAGE_DIR). Unset, gunicorn streams them with Range support.
+    UPLOAD_SENDFILE = os.environ.get('UPLOAD_SENDFILE') or None
+    UPLOAD_ACCEL_REDIRECT_PREFIX = '/protected-uploads/'
+    USE_X_SENDFILE = UPLOAD_SENDFILE == 'x-sendfile'
+    UPLOAD_CACHE_MAX_AGE = 24 * 3600  # Stored files never change, so browsers may keep them (privately)
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
     ALLOWED_EXTENSIONS = {'pdf', 'doc', 'docx', 'jpg', 'jpeg', 'png'}
     
+    # Password hashing policy (a Werkzeug method string; older hashes are upgraded at login)
+    # and the size of the thread pool hashing runs on (0 hashes on the request thread)
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD') or 'pbkdf2:sha256:600000'
+    PASSWORD_SALT_LENGTH = 16
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+    
     # Session configuration
     PERMANENT_SESSION_LIFETIME = timedelta(hours=24)
+    
+    # Pharmacy spatial index (grid cell size in degrees, ~5.5km; rebuild interval in seconds)
+    SPATIAL_INDEX_CELL_DEGREES = 0.05
+    SPATIAL_INDEX_TTL = 60
+    
+    # Medicine name search (in-memory prefix/trigram index; falls back to FTS5/pg_trgm when disabled)
+    MEDICINE_INDEX_ENABLED = True
+    MEDICINE_INDEX_TTL = 300
+    
+    # Inverted stock index (medicine -> pharmacies with it in stock) and basket search limits
+    STOCK_INDEX_TTL = 60
+    BASKET_MAX_MEDICINES = 20
+    
+    # Identical /api/search-medicines requests from the same grid cell (~1.1km; None disables)
+    # share one computation, and its result is cached for SEARCH_RESULT_TTL seconds
+    SEARCH_COALESCE_CELL_DEGREES = 0.01
+    SEARCH_RESULT_TTL = 5
+    
+    # Async serving (asgi.py): endpoints it serves and the threads their views run on
+    ASGI_PATHS = {'GET': ('/api/doctors', '/api/specialties'), 'POST': ('/api/search-medicines',)}
+    ASGI_DB_THREADS = int(os.environ.get('ASGI_DB_THREADS', 8))
+    
+    # SQL statements allowed per request, enforced in debug/testing mode (None disables)
+    SQL_QUERY_BUDGET = 15
+    SQL_QUERY_BUDGETS = {}  # Per-endpoint overrides, e.g. {'routes.admin_dashboard': 10}
+    
+    # VIP consult matching: doctors rated above MATCHING_MIN_RATING are kept in per-specialty pools
+    # (rebuilt on rating changes and every MATCHING_POOL_TTL seconds) and drawn at random
+    MATCHING_MIN_RATING = 3.0
+    MATCHING_POOL_TTL = 60
+    MATCHING_WEIGHT_BY_RATING = True  # Higher-rated doctors are drawn proportionally more often
+    MATCHING_WEIGHT_BY_LOAD = True  # Each pending assignment lowers a doctor's chance: 1 / (1 + pending)
+    
+    # Admin dashboard counts are cached for this many seconds (dropped early on writes)
+    ADMIN_STATS_TTL = 30
+    ADMIN_PAGE_SIZE = 50  # Rows per admin table page
+    
+    # Response cache for read-mostly endpoints ('lru' in-process, or 'null' to disable)
+    CACHE_BACKEND = 'lru'
+    CACHE_MAX_ENTRIES = 1024
+    CACHE_DEFAULT_TTL = 60
+    
+    # Reuse the logged-in user's identity across requests for this many seconds (0 disables).
+    # Writes in this worker invalidate it at once; other workers may lag by up to the TTL.
+    USER_CACHE_TTL = 30
+    
+    # Bulk stock imports are committed in transactions of this many rows
+    STOCK_IMPORT_CHUNK_SIZE = 1000
+    
+    # Prometheus metrics on /metrics (off by default). With several gunicorn workers, point
+    # METRICS_DIR at a local directory (emptied on deploy) so every worker reports the total.
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '').lower() in ('1', 'true', 'yes')
+    METRICS_DIR = os.environ.get('METRICS_DIR')
+    METRICS_FLUSH_INTERVAL = 1.0  # Seconds between writes of each worker's metrics file
+    
+    # Slow-query log: statements slower than this many ms are logged with redacted parameters
+    # and their EXPLAIN plan (None disables). Logs go to SLOW_QUERY_LOG_FILE or stderr.
+    SLOW_QUERY_THRESHOLD_MS = float(os.environ['SLOW_QUERY_THRESHOLD_MS']) if os.environ.get('SLOW_QUERY_THRESHOLD_MS') else None
+    SLOW_QUERY_LOG_FILE = os.environ.get('SLOW_QUERY_LOG_FILE')
+    SLOW_QUERY_SUMMARY_INTERVAL = 300  # Seconds between summaries of statements ranked by total time
+    SLOW_QUERY_SUMMARY_SIZE = 10
 
 
 class ProductionConfig(Config):
@@ -32,6 +135,7 @@ class ProductionConfig(Config):
     if db_uri and 'postgres' in db_uri:
         db_uri = 'postgresql+pg8000://' + db_uri.split('://', 1)[1]
     SQLALCHEMY_DATABASE_URI = db_uri
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(db_uri)
 
 
 class DevelopmentConfig(Config):
@@ -0,0 +1,77 @@
+import heapq
+import math
+from array import array
+
+try:
+    import numpy as np
+except ImportError:  # Listed in requirements.txt; the array-module fallback is several times slower
+    np = None
+
+# Radius of Earth in kilometers
+EARTH_RADIUS_KM = 6371.0
+
+
+def haversine_distance(lat1, lon1, lat2, lon2):
+    """
+    Calculate the great circle distance between two points on Earth (in km)
+    using the Haversine formula
+    """
+    # Convert to radians
+    lat1_rad = math.radians(lat1)
+    lon1_rad = math.radians(lon1)
+    lat2_rad = math.radians(lat2)
+    lon2_rad = math.radians(lon2)
+
+    # Haversine formula
+    dlat = lat2_rad - lat1_rad
+    dlon = lon2_rad - lon1_rad
+
+    a = math.sin(dlat / 2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlon / 2)**2
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+    return EARTH_RADIUS_KM * c
+
+
+def haversine_many(lat, lng, lats, lngs):
+    """
+    Distances (km) from one point to many points in a single batch.
+    Returns a NumPy array when NumPy is installed, else an array('d').
+    """
+    if np is not None:
+        lat_rad = np.radians(lat)
+        lats_rad = np.radians(np.asarray(lats, dtype=np.float64))
+        dlat = lats_rad - lat_rad
+        dlon = np.radians(np.asarray(lngs, dtype=np.float64) - lng)
+        a = np.sin(dlat / 2)**2 + np.cos(lat_rad) * np.cos(lats_rad) * np.sin(dlon / 2)**2
+        return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+    lat_rad = math.radians(lat)
+    cos_lat = math.cos(lat_rad)
+    radians, sin, cos, asin, sqrt = math.radians, math.sin, math.cos, math.asin, math.sqrt
+    result = array('d')
+    for plat, plng in zip(lats, lngs):
+        plat_rad = radians(plat)
+        a = sin((plat_rad - lat_rad) / 2)**2 + cos_lat * cos(plat_rad) * sin(radians(plng - lng) / 2)**2
+        result.append(2 * EARTH_RADIUS_KM * asin(sqrt(min(a, 1.0))))
+    return result
+
+
+def nearest_k(distances, k):
+    """Indices of the k smallest distances, nearest first, without a full sort"""
+    n = len(distances)
+    if k <= 0 or n == 0:
+        return []
+    if np is not None:
+        distances = np.asarray(distances)
+        if k < n:
+            candidates = np.argpartition(distances, k - 1)[:k]
+        else:
+            candidates = np.arange(n)
+        return candidates[np.argsort(distances[candidates], kind='stable')].tolist()
+    return heapq.nsmallest(k, range(n), key=distances.__getitem__)
+
+
+def rank_by_distance(lat, lng, ids, lats, lngs, k):
+    """Return up to k (distance_km, id) pairs nearest to (lat, lng)"""
+    distances = haversine_many(lat, lng, lats, lngs)
+    return [(float(distances[i]), ids[i]) for i in nearest_k(distances, k)]
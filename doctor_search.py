@@ -0,0 +1,180 @@
+import re
+from sqlalchemy import bindparam, event, inspect, or_, select, text
+from sqlalchemy.orm import Session
+from models import db, User, DoctorProfile
+
+MAX_TERMS = 8
+DOCUMENT_ATTRIBUTES = ('specialty', 'address', 'bio', 'user_id')
+
+# One document per doctor: name and specialty weigh most, then address, then bio
+SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE doctors_fts USING fts5("
+    "name, specialty, address, bio, tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+]
+POSTGRES_DDL = [
+    'CREATE TABLE doctor_search ('
+    'doctor_id INTEGER PRIMARY KEY REFERENCES doctor_profiles (id) ON DELETE CASCADE, '
+    'document TSVECTOR NOT NULL)',
+    'CREATE INDEX ix_doctor_search_document ON doctor_search USING gin (document)',
+]
+
+_STATEMENTS = {
+    'sqlite': {
+        'exists': "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'doctors_fts'",
+        'clear': 'DELETE FROM doctors_fts',
+        'delete': 'DELETE FROM doctors_fts WHERE rowid IN :doctor_ids',
+        'index': (
+            "INSERT INTO doctors_fts (rowid, name, specialty, address, bio) "
+            "SELECT d.id, u.name, d.specialty, coalesce(d.address, ''), coalesce(d.bio, '') "
+            "FROM doctor_profiles d JOIN users u ON u.id = d.user_id {where}"
+        ),
+        'search': (
+            'SELECT rowid FROM doctors_fts WHERE doctors_fts MATCH :query '
+            'ORDER BY bm25(doctors_fts, 10.0, 8.0, 4.0, 1.0) LIMIT :limit'
+        ),
+    },
+    'postgresql': {
+        'exists': "SELECT to_regclass('doctor_search') IS NOT NULL",
+        'clear': 'DELETE FROM doctor_search',
+        'delete': 'DELETE FROM doctor_search WHERE doctor_id IN :doctor_ids',
+        'index': (
+            "INSERT INTO doctor_search (doctor_id, document) "
+            "SELECT d.id, "
+            "setweight(to_tsvector('simple', coalesce(u.name, '')), 'A') || "
+            "setweight(to_tsvector('simple', coalesce(d.specialty, '')), 'A') || "
+            "setweight(to_tsvector('simple', coalesce(d.address, '')), 'B') || "
+            "setweight(to_tsvector('simple', coalesce(d.bio, '')), 'C') "
+            "FROM doctor_profiles d JOIN users u ON u.id = d.user_id {where} "
+            "ON CONFLICT (doctor_id) DO UPDATE SET document = excluded.document"
+        ),
+        'search': (
+            "SELECT doctor_id FROM doctor_search, to_tsquery('simple', :query) query "
+            "WHERE document @@ query ORDER BY ts_rank(document, query) DESC, doctor_id LIMIT :limit"
+        ),
+    },
+}
+
+# Engine URL -> dialect name whose search structures are installed there
+_installed = {}
+
+
+def search_terms(term):
+    """Lower-cased word tokens of a search string, safe to splice into MATCH/tsquery syntax"""
+    return re.findall(r'\w+', (term or '').casefold())[:MAX_TERMS]
+
+
+def _statement(connection, name, where=''):
+    statement = text(_STATEMENTS[connection.dialect.name][name].format(where=where))
+    if ':doctor_ids' in statement.text:
+        statement = statement.bindparams(bindparam('doctor_ids', expanding=True))
+    return statement
+
+
+def _enabled(connection):
+    return _installed.get(str(connection.engine.url)) == connection.dialect.name
+
+
+def index_doctors(connection, doctor_ids=(), user_ids=()):
+    """(Re)write the search documents of these doctors, or of the doctors of these users"""
+    if not _enabled(connection) or not (doctor_ids or user_ids):
+        return
+    doctor_ids = set(doctor_ids)
+    if user_ids:
+        doctor_ids.update(connection.execute(
+            select(DoctorProfile.id).where(DoctorProfile.user_id.in_(user_ids))
+        ).scalars())
+    if not doctor_ids:
+        return
+    parameters = {'doctor_ids': list(doctor_ids)}
+    connection.execute(_statement(connection, 'delete'), parameters)
+    connection.execute(_statement(connection, 'index', 'WHERE d.id IN :doctor_ids'), parameters)
+
+
+def remove_doctors(connection, doctor_ids):
+    if _enabled(connection) and doctor_ids:
+        connection.execute(_statement(connection, 'delete'), {'doctor_ids': list(doctor_ids)})
+
+
+def rebuild_doctor_search():
+    """Rewrite every search document, e.g. after bulk inserts that bypass the ORM"""
+    connection = db.session.connection()
+    if not _enabled(connection):
+        return
+    connection.execute(_statement(connection, 'clear'))
+    connection.execute(_statement(connection, 'index'))
+
+
+def install_doctor_search(app):
+    """Create the dialect's full-text structures (FTS5 or tsvector + GIN) and fill them once"""
+    engine = db.engine
+    dialect = engine.dialect.name
+    if dialect == 'sqlite':
+        statements = SQLITE_DDL
+    elif dialect == 'postgresql':
+        statements = POSTGRES_DDL
+    else:
+        return
+
+    try:
+        with engine.begin() as connection:
+            if connection.execute(text(_STATEMENTS[dialect]['exists'])).scalar():
+                _installed[str(engine.url)] = dialect
+                return
+            for statement in statements:
+                connection.execute(text(statement))
+        _installed[str(engine.url)] = dialect
+        rebuild_doctor_search()
+        db.session.commit()
+    except Exception as exc:  # e.g. SQLite built without FTS5
+        _installed.pop(str(engine.url), None)
+        app.logger.warning('Doctor search index not installed: %s', exc)
+
+
+def search_doctors(term, limit=20):
+    """
+    Ids of the doctors best matching every word of term (as prefixes), most
+    relevant first: BM25 on SQLite, ts_rank on PostgreSQL. Other databases
+    get an unranked ILIKE scan.
+    """
+    terms = search_terms(term)
+    if not terms:
+        return []
+    connection = db.session.connection()
+    if _enabled(connection):
+        if connection.dialect.name == 'sqlite':
+            query = ' '.join(f'"{word}"*' for word in terms)
+        else:
+            query = ' & '.join(f'{word}:*' for word in terms)
+        return connection.execute(_statement(connection, 'search'), {'query': query, 'limit': limit}).scalars().all()
+
+    columns = (User.name, DoctorProfile.specialty, DoctorProfile.address, DoctorProfile.bio)
+    query = select(DoctorProfile.id).join(User, DoctorProfile.user_id == User.id)
+    for word in terms:
+        query = query.where(or_(*[column.ilike(f'%{word}%') for column in columns]))
+    return db.session.scalars(query.order_by(DoctorProfile.id).limit(limit)).all()
+
+
+def _changed(obj, attributes):
+    state = inspect(obj)
+    return any(state.attrs[name].history.has_changes() for name in attributes)
+
+
+@event.listens_for(Session, 'after_flush')
+def _index_changed_doctors(session, flush_context):
+    # Runs in the flush's transaction, so the index commits or rolls back with the change
+    doctor_ids, user_ids, removed = set(), set(), set()
+    for obj in session.new:
+        if isinstance(obj, DoctorProfile):
+            doctor_ids.add(obj.id)
+    for obj in session.dirty:
+        if isinstance(obj, DoctorProfile) and _changed(obj, DOCUMENT_ATTRIBUTES):
+            doctor_ids.add(obj.id)
+        elif isinstance(obj, User) and _changed(obj, ('name',)):
+            user_ids.add(obj.id)
+    for obj in session.deleted:
+        if isinstance(obj, DoctorProfile):
+            removed.add(obj.id)
+    if removed:
+        remove_doctors(session.connection(), removed)
+    if doctor_ids - removed or user_ids:
+        index_doctors(session.connection(), doctor_ids - removed, user_ids)
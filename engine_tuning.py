@@ -0,0 +1,51 @@
+import os
+import weakref
+from sqlalchemy import event
+from models import db
+
+# Engines whose pools a forked child empties; weak so apps dropped by tests or benchmarks can go
+_fork_safe_engines = weakref.WeakSet()
+
+
+def _reset_pools_after_fork():
+    for engine in list(_fork_safe_engines):
+        engine.dispose(close=False)  # Leave the parent's connections alone
+
+
+if hasattr(os, 'register_at_fork'):  # POSIX only; Windows has no fork
+    os.register_at_fork(after_in_child=_reset_pools_after_fork)
+
+
+def apply_sqlite_pragmas(dbapi_connection, pragmas):
+    """Run PRAGMA statements on a raw SQLite connection"""
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+    finally:
+        cursor.close()
+
+
+def tune_engine(engine, sqlite_pragmas):
+    """Apply connect-time PRAGMAs to a SQLite engine (pool options come from SQLALCHEMY_ENGINE_OPTIONS)"""
+    if engine.dialect.name != 'sqlite' or not sqlite_pragmas:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def _on_connect(dbapi_connection, connection_record):
+        apply_sqlite_pragmas(dbapi_connection, sqlite_pragmas)
+
+    engine.dispose()  # Connections opened before the listener existed get reopened with the PRAGMAs
+
+
+def init_app(app):
+    """
+    Tune the app's engines and make their pools fork-safe: a child process
+    (e.g. a gunicorn worker forked from a --preload master) starts with an
+    empty pool instead of sharing the parent's sockets and SQLite handles.
+    """
+    with app.app_context():
+        engines = list(db.engines.values())
+    for engine in engines:
+        tune_engine(engine, app.config['SQLITE_PRAGMAS'])
+        _fork_safe_engines.add(engine)
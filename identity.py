@@ -0,0 +1,78 @@
+from flask import current_app
+from sqlalchemy import inspect
+from sqlalchemy.orm import joinedload, make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+from models import db, User, DoctorProfile, Pharmacy
+from cache import cache, tag_writes
+
+
+def user_tag(user_id):
+    """Cache tag covering a user's identity and profile rows"""
+    return f'user:{user_id}'
+
+
+def _columns(obj):
+    return {attr.key: getattr(obj, attr.key) for attr in inspect(type(obj)).column_attrs}
+
+
+def _attach(model, values):
+    """Re-attach a cached row to the session without a SELECT"""
+    obj = model(**values)
+    make_transient_to_detached(obj)
+    return db.session.merge(obj, load=False)
+
+
+def _snapshot(user):
+    return {
+        'user': _columns(user),
+        'doctor_profile': _columns(user.doctor_profile) if user.doctor_profile else None,
+        'owned_pharmacy': _columns(user.owned_pharmacy) if user.owned_pharmacy else None
+    }
+
+
+def _restore(snapshot):
+    user = _attach(User, snapshot['user'])
+    for relationship, model in (('doctor_profile', DoctorProfile), ('owned_pharmacy', Pharmacy)):
+        values = snapshot[relationship]
+        set_committed_value(user, relationship, _attach(model, values) if values else None)
+    return user
+
+
+def load_identity(user_id):
+    """
+    Load the authenticated user together with their doctor profile and
+    pharmacy. Flask-Login already memoizes the result for the request; with
+    USER_CACHE_TTL set, a snapshot is also reused across requests until the
+    TTL passes or this worker commits a change to any of the three rows.
+
+    The snapshot is for reading only: views that check or write user columns
+    (such as plan limits) reload the row first, see fresh_user().
+    """
+    ttl = current_app.config['USER_CACHE_TTL']
+    loaded = {}
+
+    def load():
+        user = User.query.options(
+            joinedload(User.doctor_profile), joinedload(User.owned_pharmacy)
+        ).filter_by(id=user_id).first()
+        loaded['user'] = user
+        return _snapshot(user) if user is not None else None
+
+    if not ttl:
+        load()
+        return loaded['user']
+    # get_or_set records tag versions before the query, so a commit racing it still invalidates
+    snapshot = cache.get_or_set(f'identity:{user_id}', load, ttl, tags=[user_tag(user_id)])
+    if 'user' in loaded:
+        return loaded['user']
+    return _restore(snapshot) if snapshot is not None else None
+
+
+def fresh_user(user):
+    """Re-read a (possibly cached) user's row from the database before acting on it"""
+    return db.session.get(User, user.id, populate_existing=True)
+
+
+tag_writes(User, lambda user: [user_tag(user.id)])
+tag_writes(DoctorProfile, lambda profile: [user_tag(profile.user_id)])
+tag_writes(Pharmacy, lambda pharmacy: [user_tag(pharmacy.user_id)] if pharmacy.user_id else [])
@@ -0,0 +1,142 @@
+import random
+import threading
+import time
+from bisect import bisect_right
+from itertools import accumulate
+from flask import current_app
+from sqlalchemy import event, func, insert, select
+from models import db, DoctorProfile, Review, VIPConsultAssignment
+
+
+class DoctorPool:
+    """
+    In-process pools of doctors qualified for VIP consults.
+
+    Doctors rated above MATCHING_MIN_RATING are grouped by specialty, with
+    cumulative rating weights precomputed per pool, so drawing k doctors
+    costs O(k log n) at worst instead of loading every candidate. Pending
+    assignment counts are tracked alongside and applied by rejection, so
+    busy doctors are picked less often without rebuilding the weights.
+    The pools are rebuilt after rating or profile changes and on a TTL.
+    """
+
+    def __init__(self):
+        self._pools = {}     # specialty key (or None for everyone) -> (ids, cumulative weights)
+        self._pending = {}   # doctor id -> pending assignments
+        self._built_at = None
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        """Mark the pools stale so the next draw rebuilds them"""
+        self._built_at = None
+
+    @staticmethod
+    def _key(specialty):
+        return ' '.join((specialty or '').casefold().split())
+
+    def rebuild(self):
+        """Load qualified doctors, their ratings and pending loads in one query"""
+        pending = (
+            select(VIPConsultAssignment.doctor_id, func.count().label('pending'))
+            .where(VIPConsultAssignment.status == 'pending')
+            .group_by(VIPConsultAssignment.doctor_id)
+            .subquery()
+        )
+        rows = db.session.execute(
+            select(DoctorProfile.id, DoctorProfile.specialty, DoctorProfile.average_rating,
+                   func.coalesce(pending.c.pending, 0))
+            .outerjoin(pending, pending.c.doctor_id == DoctorProfile.id)
+            .where(DoctorProfile.average_rating > current_app.config['MATCHING_MIN_RATING'])
+        ).all()
+
+        members = {None: []}
+        pending_counts = {}
+        for doctor_id, specialty, rating, pending_count in rows:
+            members[None].append((doctor_id, rating))
+            members.setdefault(self._key(specialty), []).append((doctor_id, rating))
+            pending_counts[doctor_id] = pending_count
+
+        pools = {}
+        for key, doctors in members.items():
+            ids = [doctor_id for doctor_id, _ in doctors]
+            pools[key] = (ids, list(accumulate(rating for _, rating in doctors)))
+        self._pools, self._pending = pools, pending_counts
+        self._built_at = time.monotonic()
+
+    def _ensure_fresh(self):
+        # Other workers change ratings and loads too, so rebuild periodically
+        ttl = current_app.config['MATCHING_POOL_TTL']
+        if self._built_at is None or time.monotonic() - self._built_at > ttl:
+            with self._lock:
+                if self._built_at is None or time.monotonic() - self._built_at > ttl:
+                    self.rebuild()
+
+    def _draw(self, ids, cumulative, k, exclude, by_rating, by_load):
+        """Up to k distinct ids not in exclude (a subset of ids), weighted as configured"""
+        k = min(k, len(ids) - len(exclude))
+        if k <= 0:
+            return []
+        if not (by_rating or by_load) and not exclude:
+            return random.sample(ids, k)
+
+        chosen = []
+        seen = set(exclude)
+        for _ in range(50 * k):  # Rejection sampling; expected draws stay O(k) while k << n
+            if len(chosen) == k:
+                return chosen
+            if by_rating:
+                index = bisect_right(cumulative, random.random() * cumulative[-1])
+            else:
+                index = random.randrange(len(ids))
+            doctor_id = ids[min(index, len(ids) - 1)]
+            if doctor_id in seen:
+                continue
+            if by_load and random.random() * (1 + self._pending.get(doctor_id, 0)) >= 1:
+                continue  # Accepted with probability 1 / (1 + pending)
+            seen.add(doctor_id)
+            chosen.append(doctor_id)
+
+        # Pool nearly exhausted by exclusions: fill the rest uniformly
+        rest = [doctor_id for doctor_id in ids if doctor_id not in seen]
+        return chosen + random.sample(rest, min(k - len(chosen), len(rest)))
+
+    def pick(self, specialty, k):
+        """
+        Choose k doctors for a consult: from the specialty's pool first,
+        topped up from all qualified doctors when the specialty has too few.
+        """
+        self._ensure_fresh()
+        by_rating = current_app.config['MATCHING_WEIGHT_BY_RATING']
+        by_load = current_app.config['MATCHING_WEIGHT_BY_LOAD']
+        with self._lock:
+            ids, cumulative = self._pools.get(self._key(specialty), ([], []))
+            chosen = self._draw(ids, cumulative, k, (), by_rating, by_load)
+            if len(chosen) < k:
+                everyone, weights = self._pools[None]
+                chosen += self._draw(everyone, weights, k - len(chosen), set(chosen), by_rating, by_load)
+            for doctor_id in chosen:
+                self._pending[doctor_id] = self._pending.get(doctor_id, 0) + 1
+            return chosen
+
+
+doctor_pool = DoctorPool()
+
+
+def assign_doctors(consult, k=5):
+    """Pick up to k doctors for a flushed consult and insert their assignments in one statement"""
+    doctor_ids = doctor_pool.pick(consult.specialty, k)
+    if doctor_ids:
+        db.session.execute(insert(VIPConsultAssignment), [
+            {'consult_id': consult.id, 'doctor_id': doctor_id, 'status': 'pending'} for doctor_id in doctor_ids
+        ])
+    return doctor_ids
+
+
+@event.listens_for(Review, 'after_insert')
+@event.listens_for(Review, 'after_update')
+@event.listens_for(Review, 'after_delete')
+@event.listens_for(DoctorProfile, 'after_insert')
+@event.listens_for(DoctorProfile, 'after_update')
+@event.listens_for(DoctorProfile, 'after_delete')
+def _invalidate_doctor_pool(mapper, connection, target):
+    doctor_pool.invalidate()
@@ -0,0 +1,228 @@
+import atexit
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from time import perf_counter
+from flask import Response, g, has_request_context, request
+from flask.signals import before_render_template, request_finished, request_started, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+# name -> (type, help, histogram buckets)
+METRICS = {
+    'medica_http_requests_total': ('counter', 'Requests handled, by endpoint, method and status', None),
+    'medica_http_request_duration_seconds': ('histogram', 'Request latency by endpoint', LATENCY_BUCKETS),
+    'medica_http_response_size_bytes': ('histogram', 'Response body size by endpoint', SIZE_BUCKETS),
+    'medica_sql_statements_total': ('counter', 'SQL statements executed, by endpoint', None),
+    'medica_sql_duration_seconds_total': ('counter', 'Time spent executing SQL, by endpoint', None),
+    'medica_template_render_seconds_total': ('counter', 'Time spent rendering templates, by endpoint', None)
+}
+
+
+class MetricsStore:
+    """
+    Metric values for this process. With a directory configured, values are
+    also written to <directory>/metrics_<pid>.json by a background thread
+    every flush interval, so that any gunicorn worker can report the sum over
+    all workers. Files of exited workers are kept so counters never go backwards.
+    """
+
+    def __init__(self):
+        self.directory = None
+        self.flush_interval = 1.0
+        self._values = defaultdict(float)  # (name, labels) -> value
+        self._pid = None
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    def configure(self, directory, flush_interval):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, pid):
+        return os.path.join(self.directory, f'metrics_{pid}.json')
+
+    def _check_pid(self):
+        # After a fork, drop the parent's values; if this pid had a file before, continue from it
+        pid = os.getpid()
+        if pid != self._pid:
+            self._pid = pid
+            self._values = defaultdict(float)
+            if self.directory:
+                if os.path.exists(self._path(pid)):
+                    self._values.update(self._read(self._path(pid)))
+                threading.Thread(target=self._flush_periodically, args=(pid,), daemon=True).start()
+
+    def _flush_periodically(self, pid):
+        while os.getpid() == pid:
+            time.sleep(self.flush_interval)
+            if self._dirty:
+                self.flush()
+
+    def inc(self, name, labels, amount=1.0):
+        with self._lock:
+            self._check_pid()
+            self._values[(name, labels)] += amount
+            self._dirty = True
+
+    def observe(self, name, labels, value):
+        buckets = METRICS[name][2]
+        bucket = next((str(bound) for bound in buckets if value <= bound), '+Inf')
+        with self._lock:
+            self._check_pid()
+            self._values[(name + '_bucket', labels + (('le', bucket),))] += 1
+            self._values[(name + '_sum', labels)] += value
+            self._values[(name + '_count', labels)] += 1
+            self._dirty = True
+
+    def flush(self):
+        """Write this process's values to its file"""
+        if not self.directory:
+            return
+        with self._lock:
+            self._check_pid()
+            rows = [[name, list(labels), value] for (name, labels), value in self._values.items()]
+            self._dirty = False
+        path = self._path(self._pid)
+        temporary = f'{path}.tmp'
+        with open(temporary, 'w') as f:
+            json.dump(rows, f)
+        os.replace(temporary, path)  # Atomic, so readers never see a partial file
+
+    @staticmethod
+    def _read(path):
+        try:
+            with open(path) as f:
+                return {(name, tuple(tuple(pair) for pair in labels)): value for name, labels, value in json.load(f)}
+        except (OSError, ValueError):
+            return {}
+
+    def collect(self):
+        """Values summed over every worker (or just this process without a directory)"""
+        if not self.directory:
+            with self._lock:
+                self._check_pid()
+                return dict(self._values)
+        self.flush()
+        totals = defaultdict(float)
+        for filename in os.listdir(self.directory):
+            if filename.startswith('metrics_') and filename.endswith('.json'):
+                for key, value in self._read(os.path.join(self.directory, filename)).items():
+                    totals[key] += value
+        return totals
+
+
+store = MetricsStore()
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}'
+
+
+def render(values):
+    """Prometheus text exposition format for collected values"""
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'counter':
+            for (metric, labels), value in sorted(values.items()):
+                if metric == name:
+                    lines.append(f'{name}{_format_labels(labels)} {value:g}')
+            continue
+
+        series = sorted(labels for metric, labels in values if metric == name + '_count')
+        for labels in series:
+            cumulative = 0.0
+            for bound in [str(bound) for bound in buckets] + ['+Inf']:
+                cumulative += values.get((name + '_bucket', labels + (('le', bound),)), 0.0)
+                lines.append(f'{name}_bucket{_format_labels(labels + (("le", bound),))} {cumulative:g}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {values[(name + "_sum", labels)]:g}')
+            lines.append(f'{name}_count{_format_labels(labels)} {values[(name + "_count", labels)]:g}')
+    return '\n'.join(lines) + '\n'
+
+
+def _on_request_started(sender, **extra):
+    g.metrics = {'started': perf_counter(), 'sql_count': 0, 'sql_time': 0.0, 'template_time': 0.0, 'templates': []}
+
+
+def _on_request_finished(sender, response, **extra):
+    state = g.pop('metrics', None)
+    if state is None:
+        return
+    endpoint = request.endpoint or 'unmatched'
+    labels = (('endpoint', endpoint),)
+    store.inc('medica_http_requests_total', labels + (('method', request.method), ('status', str(response.status_code))))
+    store.observe('medica_http_request_duration_seconds', labels, perf_counter() - state['started'])
+    size = response.calculate_content_length()
+    if size is not None:
+        store.observe('medica_http_response_size_bytes', labels, size)
+    store.inc('medica_sql_statements_total', labels, state['sql_count'])
+    store.inc('medica_sql_duration_seconds_total', labels, state['sql_time'])
+    store.inc('medica_template_render_seconds_total', labels, state['template_time'])
+
+
+def _on_before_render(sender, template, context, **extra):
+    state = g.get('metrics')
+    if state is not None:
+        state['templates'].append(perf_counter())
+
+
+def _on_rendered(sender, template, context, **extra):
+    state = g.get('metrics')
+    if state is not None and state['templates']:
+        state['template_time'] += perf_counter() - state['templates'].pop()
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_statement_timer(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'metrics' in g:
+        conn.info.setdefault('metrics_started', []).append(perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _stop_statement_timer(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('metrics_started')
+    if started:
+        elapsed = perf_counter() - started.pop()
+        if has_request_context() and 'metrics' in g:
+            g.metrics['sql_count'] += 1
+            g.metrics['sql_time'] += elapsed
+
+
+@event.listens_for(Engine, 'handle_error')
+def _discard_statement_timer(exception_context):
+    connection = exception_context.connection
+    if connection is not None and connection.info.get('metrics_started'):
+        connection.info['metrics_started'].pop()
+
+
+def metrics_view():
+    return Response(render(store.collect()), mimetype='text/plain; version=0.0.4')
+
+
+def init_app(app):
+    """
+    Record per-endpoint request, SQL and template timings and serve them in
+    Prometheus format on /metrics. Off unless METRICS_ENABLED is set.
+    """
+    if not app.config['METRICS_ENABLED']:
+        return
+
+    store.configure(app.config['METRICS_DIR'], app.config['METRICS_FLUSH_INTERVAL'])
+    request_started.connect(_on_request_started, app)
+    request_finished.connect(_on_request_finished, app)
+    before_render_template.connect(_on_before_render, app)
+    template_rendered.connect(_on_rendered, app)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
+    atexit.register(store.flush)
@@ -1,6 +1,9 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import event, func, inspect, select, case, cast, bindparam, or_, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
+from passwords import password_hasher
 from datetime import datetime
 
 db = SQLAlchemy()
@@ -11,10 +14,10 @@ class User(UserMixin, db.Model):
     __tablename__ = 'users'
     
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(100), nullable=False)
+    name = db.Column(db.String(100), nullable=False, index=True)
     email = db.Column(db.String(120), unique=True, nullable=False, index=True)
     password_hash = db.Column(db.String(255), nullable=False)
-    role = db.Column(db.String(20), nullable=False, default='patient')  # 'patient', 'doctor', 'admin', 'pharmacy'
+    role = db.Column(db.String(20), nullable=False, default='patient', index=True)  # 'patient', 'doctor', 'admin', 'pharmacy'
     is_vip = db.Column(db.Boolean, default=False, nullable=False)
     balance = db.Column(db.Float, default=0.0, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -25,20 +28,25 @@ class User(UserMixin, db.Model):
     doctor_profile = db.relationship('DoctorProfile', backref='user', uselist=False, cascade='all, delete-orphan')
     reviews_given = db.relationship('Review', foreign_keys='Review.patient_id', backref='patient', lazy='dynamic')
     vip_consults = db.relationship('VIPConsult', backref='patient', lazy='dynamic')
+    owned_pharmacy = db.relationship('Pharmacy', uselist=False, viewonly=True)
     
     def set_password(self, password):
         """Hash and set password"""
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
     
     def check_password(self, password):
-        """Check password against hash"""
-        return check_password_hash(self.password_hash, password)
+        """Check password against hash, upgrading a hash made under an older policy (caller commits)"""
+        if not password_hasher.verify(self.password_hash, password):
+            return False
+        if password_hasher.needs_rehash(self.password_hash):
+            self.password_hash = password_hasher.hash(password)
+        return True
     
     @property
     def pharmacy(self):
         """Get pharmacy for pharmacy users"""
         if self.role == 'pharmacy':
-            return Pharmacy.query.filter_by(user_id=self.id).first()
+            return self.owned_pharmacy  # Loaded once per instance
         return None
     
     def __repr__(self):
@@ -48,29 +56,25 @@ class User(UserMixin, db.Model):
 class DoctorProfile(db.Model):
     """Doctor profile with specialty and ratings"""
     __tablename__ = 'doctor_profiles'
+    __table_args__ = (
+        db.Index('ix_doctor_profiles_rating_id', 'average_rating', 'id'),  # Keyset pagination by rating
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), unique=True, nullable=False)
-    specialty = db.Column(db.String(100), nullable=False)
+    specialty = db.Column(db.String(100), nullable=False, index=True)
     address = db.Column(db.String(255))
     phone = db.Column(db.String(20))
     bio = db.Column(db.Text)
-    average_rating = db.Column(db.Float, default=0.0, nullable=False)
+    average_rating = db.Column(db.Float, default=0.0, nullable=False)  # Derived from rating_sum / rating_count
+    rating_sum = db.Column(db.Integer, default=0, nullable=False)
+    rating_count = db.Column(db.Integer, default=0, nullable=False)
     
     # Relationships
     reviews = db.relationship('Review', backref='doctor', lazy='dynamic', cascade='all, delete-orphan')
     availabilities = db.relationship('Availability', backref='doctor', lazy='dynamic', cascade='all, delete-orphan')
     vip_assignments = db.relationship('VIPConsultAssignment', backref='doctor', lazy='dynamic')
     
-    def update_average_rating(self):
-        """Recalculate and update average rating from reviews"""
-        reviews = self.reviews.all()
-        if reviews:
-            self.average_rating = sum(review.rating for review in reviews) / len(reviews)
-        else:
-            self.average_rating = 0.0
-        db.session.commit()
-    
     def __repr__(self):
         return f'<DoctorProfile {self.user.name if self.user else None}>'
 
@@ -80,9 +84,9 @@ class Review(db.Model):
     __tablename__ = 'reviews'
     
     id = db.Column(db.Integer, primary_key=True)
-    doctor_id = db.Column(db.Integer, db.ForeignKey('doctor_profiles.id', ondelete='CASCADE'), nullable=False)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('doctor_profiles.id', ondelete='CASCADE'), nullable=False, index=True)
     patient_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
-    rating = db.Column(db.Integer, nullable=False)  # 1-5
+    rating = db.Column(db.Integer, nullable=False, index=True)  # 1-5
     comment = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
@@ -90,20 +94,207 @@ class Review(db.Model):
         return f'<Review {self.rating} stars by Patient {self.patient_id}>'
 
 
+def _rating_values(rating_sum, rating_count):
+    """Column values for a doctor's rating aggregates, average derived in SQL"""
+    return {
+        'rating_sum': rating_sum,
+        'rating_count': rating_count,
+        'average_rating': case((rating_count > 0, cast(rating_sum, db.Float) / rating_count), else_=0.0)
+    }
+
+
+def _adjust_doctor_rating(connection, doctor_id, rating_delta, count_delta):
+    """Atomically shift a doctor's rating aggregates in the current transaction"""
+    table = DoctorProfile.__table__
+    connection.execute(
+        table.update()
+        .where(table.c.id == doctor_id)
+        .values(**_rating_values(table.c.rating_sum + rating_delta, table.c.rating_count + count_delta))
+    )
+
+
+@event.listens_for(Review, 'after_insert')
+def _review_added(mapper, connection, target):
+    _adjust_doctor_rating(connection, target.doctor_id, target.rating, 1)
+
+
+@event.listens_for(Review, 'after_delete')
+def _review_deleted(mapper, connection, target):
+    _adjust_doctor_rating(connection, target.doctor_id, -target.rating, -1)
+
+
+@event.listens_for(Review, 'after_update')
+def _review_changed(mapper, connection, target):
+    rating = inspect(target).attrs.rating.history
+    doctor = inspect(target).attrs.doctor_id.history
+    if rating.has_changes() or doctor.has_changes():
+        old_rating = rating.deleted[0] if rating.deleted else target.rating
+        old_doctor_id = doctor.deleted[0] if doctor.deleted else target.doctor_id
+        _adjust_doctor_rating(connection, old_doctor_id, -old_rating, -1)
+        _adjust_doctor_rating(connection, target.doctor_id, target.rating, 1)
+
+
+def _add_missing_columns(connection, table, definitions):
+    """
+    ALTER TABLE ... ADD COLUMN for each {name: SQL type and constraints} the
+    table lacks, then create its missing indexes: create_all leaves tables
+    that already exist alone, so databases from before a column was added
+    need this.
+    """
+    existing = {column['name'] for column in inspect(connection).get_columns(table.name)}
+    for name, definition in definitions.items():
+        if name not in existing:
+            connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {name} {definition}'))
+    for index in table.indexes:
+        index.create(connection, checkfirst=True)
+
+
+def recompute_doctor_ratings():
+    """
+    Rebuild every doctor's rating aggregates from the reviews table with a
+    single GROUP BY (adding the aggregate columns first on a database from
+    before they existed). Returns the number of doctors with at least one review.
+    """
+    table = DoctorProfile.__table__
+    _add_missing_columns(db.session.connection(), table, {
+        'rating_sum': 'INTEGER DEFAULT 0 NOT NULL',
+        'rating_count': 'INTEGER DEFAULT 0 NOT NULL'
+    })
+    totals = (
+        select(
+            Review.doctor_id,
+            func.sum(Review.rating).label('rating_sum'),
+            func.count(Review.id).label('rating_count')
+        )
+        .group_by(Review.doctor_id)
+        .subquery()
+    )
+    db.session.execute(table.update().values(rating_sum=0, rating_count=0, average_rating=0.0))
+    result = db.session.execute(
+        table.update()
+        .where(table.c.id == totals.c.doctor_id)
+        .values(**_rating_values(totals.c.rating_sum, totals.c.rating_count))
+    )
+    return result.rowcount
+
+
+DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+MINUTES_PER_DAY = 24 * 60
+
+
+def minute_of_week(day, at):
+    """Minutes since Monday 00:00 for a day name and a time"""
+    return DAYS.index(day) * MINUTES_PER_DAY + at.hour * 60 + at.minute
+
+
+def _minute_of_week_default(time_column):
+    # Context-sensitive default, so Core bulk inserts (seed, imports) get the interval too
+    def default(context):
+        parameters = context.get_current_parameters()
+        return minute_of_week(parameters['day'], parameters[time_column])
+    return default
+
+
 class Availability(db.Model):
     """Doctor availability schedule"""
     __tablename__ = 'availabilities'
+    __table_args__ = (
+        # Interval index: a slot [start_minute, end_minute) never crosses midnight, so the
+        # slots covering a moment all start between that day's midnight and the moment
+        db.Index('ix_availabilities_start_end', 'start_minute', 'end_minute'),
+        db.Index('ix_availabilities_doctor_start', 'doctor_id', 'start_minute'),  # Per-doctor overlap checks
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     doctor_id = db.Column(db.Integer, db.ForeignKey('doctor_profiles.id', ondelete='CASCADE'), nullable=False)
     day = db.Column(db.String(20), nullable=False)  # e.g., 'Monday', 'Tuesday'
     start_time = db.Column(db.Time, nullable=False)
     end_time = db.Column(db.Time, nullable=False)
+    start_minute = db.Column(db.Integer, nullable=False, default=_minute_of_week_default('start_time'))  # Minute of week
+    end_minute = db.Column(db.Integer, nullable=False, default=_minute_of_week_default('end_time'))
     
     def __repr__(self):
         return f'<Availability {self.day} {self.start_time}-{self.end_time}>'
 
 
+@event.listens_for(Availability, 'before_update')
+def _availability_moved(mapper, connection, target):
+    target.start_minute = minute_of_week(target.day, target.start_time)
+    target.end_minute = minute_of_week(target.day, target.end_time)
+
+
+def availability_overlaps(doctor_id, start_minute, end_minute):
+    """
+    Whether [start_minute, end_minute) overlaps one of the doctor's slots.
+    A doctor's slots never overlap each other, so only the last one starting
+    before end_minute can: one index seek instead of loading the whole day.
+    (Rows from before this check existed may; see overlapping_availabilities.)
+    """
+    previous_end = db.session.scalar(
+        select(Availability.end_minute)
+        .where(Availability.doctor_id == doctor_id, Availability.start_minute < end_minute)
+        .order_by(Availability.start_minute.desc())
+        .limit(1)
+    )
+    return previous_end is not None and previous_end > start_minute
+
+
+def available_doctor_slots(minute):
+    """Query of (doctor id, end_minute) for every slot covering a minute of the week"""
+    day_start = minute - minute % MINUTES_PER_DAY
+    return select(Availability.doctor_id, Availability.end_minute).where(
+        Availability.start_minute.between(day_start, minute),
+        Availability.end_minute > minute
+    )
+
+
+
+def backfill_availability_minutes():
+    """
+    Fill start_minute/end_minute on rows written before those columns existed,
+    adding the columns and their indexes first on such a database (create_all
+    leaves existing tables alone). Returns (rows filled, ids of rows whose day
+    is not one of DAYS, left empty).
+    """
+    table = Availability.__table__
+    connection = db.session.connection()
+    # Nullable here: the existing rows only get a value below
+    _add_missing_columns(connection, table, {'start_minute': 'INTEGER', 'end_minute': 'INTEGER'})
+    
+    rows = connection.execute(
+        select(table.c.id, table.c.day, table.c.start_time, table.c.end_time)
+        .where(or_(table.c.start_minute.is_(None), table.c.end_minute.is_(None)))
+    )
+    values, invalid = [], []
+    for row_id, day, start_time, end_time in rows:
+        if day not in DAYS:
+            invalid.append(row_id)
+            continue
+        values.append({'row_id': row_id, 'start': minute_of_week(day, start_time), 'end': minute_of_week(day, end_time)})
+    if values:
+        connection.execute(
+            table.update().where(table.c.id == bindparam('row_id'))
+            .values(start_minute=bindparam('start'), end_minute=bindparam('end')),
+            values
+        )
+    return len(values), invalid
+
+
+def overlapping_availabilities():
+    """
+    (doctor id, slot id, slot id) for every pair of a doctor's slots that
+    overlap. New slots are rejected by availability_overlaps; legacy rows
+    were never checked, and the check assumes they do not overlap.
+    """
+    first, second = aliased(Availability), aliased(Availability)
+    return db.session.execute(
+        select(first.doctor_id, first.id, second.id)
+        .join(second, (second.doctor_id == first.doctor_id) & (second.id > first.id))
+        .where(first.start_minute < second.end_minute, second.start_minute < first.end_minute)
+        .order_by(first.doctor_id, first.id, second.id)
+    ).all()
+
+
 class Medicine(db.Model):
     """Medicine catalog"""
     __tablename__ = 'medicines'
@@ -119,12 +310,53 @@ class Medicine(db.Model):
         return f'<Medicine {self.name}>'
 
 
+class IndexVersion(db.Model):
+    """
+    Change counter per in-memory index (e.g. 'medicines'), bumped in the
+    writing transaction so other workers notice edits, such as renames, that
+    leave row counts and ids unchanged
+    """
+    __tablename__ = 'index_versions'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+
+def ensure_index_version(connection, name):
+    """Create an index's counter row if it is missing (create_all makes the table on older databases)"""
+    table = IndexVersion.__table__
+    if connection.execute(select(table.c.version).where(table.c.name == name)).first() is not None:
+        return
+    try:
+        with connection.begin_nested():
+            connection.execute(table.insert().values(name=name, version=0))
+    except IntegrityError:
+        pass  # Another worker created it first
+
+
+def bump_index_version(connection, name):
+    table = IndexVersion.__table__
+    connection.execute(table.update().where(table.c.name == name).values(version=table.c.version + 1))
+
+
+@event.listens_for(Medicine, 'after_insert')
+@event.listens_for(Medicine, 'after_delete')
+def _medicine_added_or_removed(mapper, connection, target):
+    bump_index_version(connection, 'medicines')  # SQLite may reuse a deleted max id
+
+
+@event.listens_for(Medicine, 'after_update')
+def _medicine_changed(mapper, connection, target):
+    if inspect(target).attrs.name.history.has_changes():
+        bump_index_version(connection, 'medicines')
+
+
 class Pharmacy(db.Model):
     """Pharmacy locations"""
     __tablename__ = 'pharmacies'
     
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(200), nullable=False)
+    name = db.Column(db.String(200), nullable=False, index=True)
     address = db.Column(db.String(255), nullable=False)
     lat = db.Column(db.Float, nullable=False, index=True)  # Added index for faster distance queries
     lng = db.Column(db.Float, nullable=False, index=True)  # Added index for faster distance queries
@@ -156,9 +388,9 @@ class VIPConsult(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     patient_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     description = db.Column(db.Text, nullable=False)
-    specialty = db.Column(db.String(100), nullable=False)
+    specialty = db.Column(db.String(100), nullable=False, index=True)
     file_path = db.Column(db.String(500))  # Path to uploaded file
-    status = db.Column(db.String(50), default='pending', nullable=False)  # 'pending', 'accepted', 'completed', 'cancelled'
+    status = db.Column(db.String(50), default='pending', nullable=False, index=True)  # 'pending', 'accepted', 'completed', 'cancelled'
     discord_link = db.Column(db.String(500))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
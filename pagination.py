@@ -0,0 +1,66 @@
+import base64
+import json
+from sqlalchemy import and_, or_
+
+
+def encode_cursor(values):
+    """Opaque, URL-safe cursor for the sort key of the last row on a page"""
+    raw = json.dumps(list(values), separators=(',', ':'), default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError on a malformed cursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError) as exc:
+        raise ValueError('Invalid cursor') from exc
+    if not isinstance(values, list):
+        raise ValueError('Invalid cursor')
+    return values
+
+
+def _cursor_value(column, value):
+    # Cursors are client input: only scalars of the column's own type may reach SQL
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        raise ValueError('Invalid cursor')
+    try:
+        expected = column.type.python_type
+    except NotImplementedError:
+        return value  # Untyped expression; any scalar compares
+    if expected is float and isinstance(value, int):
+        return float(value)
+    if not isinstance(value, expected):
+        raise ValueError('Invalid cursor')
+    return value
+
+
+def check_cursor(ordering, values):
+    """
+    Decoded cursor values checked against `ordering`: one scalar of the right
+    type per column. Raises ValueError otherwise.
+    """
+    if not isinstance(values, list) or len(values) != len(ordering):
+        raise ValueError('Invalid cursor')
+    return [_cursor_value(column, value) for (column, _), value in zip(ordering, values)]
+
+
+def keyset_after(ordering, values):
+    """
+    Filter selecting rows strictly after `values` in `ordering`, a list of
+    (column, descending) pairs whose last entry is a unique tiebreaker.
+    Builds (a > x) OR (a = x AND b > y) OR ... so mixed directions work.
+    """
+    values = check_cursor(ordering, values)
+    clauses = []
+    for position, (column, descending) in enumerate(ordering):
+        equal = [ordering[i][0] == values[i] for i in range(position)]
+        beyond = column < values[position] if descending else column > values[position]
+        clauses.append(and_(*equal, beyond))
+    return or_(*clauses)
+
+
+def order_by_clauses(ordering):
+    """ORDER BY expressions matching a keyset `ordering`"""
+    return [column.desc() if descending else column.asc() for column, descending in ordering]
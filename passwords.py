@@ -0,0 +1,75 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, generate_password_hash, check_password_hash
+
+DEFAULT_METHOD = 'pbkdf2:sha256:600000'
+
+
+def method_id(method):
+    """
+    Prefix Werkzeug writes for hashes made with `method`, defaults filled in
+    ('scrypt' -> 'scrypt:32768:8:1'), worked out without hashing anything
+    """
+    name, *args = method.split(':')
+    if name == 'scrypt':
+        n, r, p = map(int, args) if args else (2**15, 8, 1)
+        return f'scrypt:{n}:{r}:{p}'
+    if name == 'pbkdf2':
+        hash_name = args[0] if args else 'sha256'
+        iterations = int(args[1]) if len(args) > 1 else DEFAULT_PBKDF2_ITERATIONS
+        return f'pbkdf2:{hash_name}:{iterations}'
+    return method
+
+
+class PasswordHasher:
+    """
+    Password hashing policy (PASSWORD_HASH_METHOD, any Werkzeug method string
+    such as 'pbkdf2:sha256:600000' or 'scrypt:32768:8:1') run on a bounded
+    thread pool of PASSWORD_HASH_WORKERS threads.
+
+    PBKDF2 and scrypt release the GIL, so hashing on the pool lets a threaded
+    worker keep serving other requests, while the pool size caps how many
+    cores logins can take at once. Hashes made under an older policy are
+    flagged by needs_rehash() so they can be upgraded at the next login.
+    """
+
+    def __init__(self, method=DEFAULT_METHOD, salt_length=16, workers=2):
+        self.configure(method, salt_length, workers)
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+
+    def configure(self, method, salt_length, workers):
+        self.method = method
+        self.salt_length = salt_length
+        self.workers = workers
+        # Compare stored hashes against the prefix the policy actually produces
+        self.method_id = method_id(method)
+
+    def init_app(self, app):
+        self.configure(app.config['PASSWORD_HASH_METHOD'], app.config['PASSWORD_SALT_LENGTH'],
+                       app.config['PASSWORD_HASH_WORKERS'])
+
+    def _run(self, function, *args):
+        if not self.workers:
+            return function(*args)
+        with self._lock:
+            # Pool threads do not survive fork, so each (gunicorn) worker process gets its own
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password-hash')
+                self._executor_pid = os.getpid()
+            executor = self._executor
+        return executor.submit(function, *args).result()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method, self.salt_length)
+
+    def verify(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        return password_hash.split('$', 1)[0] != self.method_id
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,48 @@
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised in testing mode when a view issues more SQL statements than allowed"""
+
+
+def query_count():
+    """Number of SQL statements issued so far in the current request"""
+    return g.get('sql_query_count', 0)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        g.sql_query_count = g.get('sql_query_count', 0) + 1
+
+
+def init_app(app):
+    """
+    Enforce SQL_QUERY_BUDGET per request in debug and testing mode.
+    Over-budget views raise QueryBudgetExceeded under TESTING and log a
+    warning in debug; the count is also sent back in an X-SQL-Queries header.
+    """
+
+    @app.before_request
+    def reset_query_count():
+        # g outlives the request when an app context was already pushed (e.g. in tests)
+        g.sql_query_count = 0
+
+    @app.after_request
+    def check_query_budget(response):
+        if not (app.debug or app.testing):
+            return response
+
+        count = query_count()
+        budgets = app.config['SQL_QUERY_BUDGETS']
+        budget = budgets.get(request.endpoint, app.config['SQL_QUERY_BUDGET'])
+        response.headers['X-SQL-Queries'] = str(count)
+
+        if budget is not None and count > budget:
+            message = f'{request.endpoint} issued {count} SQL statements (budget {budget})'
+            if app.testing:
+                raise QueryBudgetExceeded(message)
+            app.logger.warning(message)
+        return response
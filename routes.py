@@ -1,15 +1,27 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, session
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, session, current_app, abort, send_from_directory
 from flask_login import login_user, logout_user, login_required, current_user
-from werkzeug.utils import secure_filename
-import os
-import random
+from sqlalchemy import func, or_, select, update
+from sqlalchemy.orm import contains_eager, joinedload
 import math
+from datetime import datetime
 from functools import wraps
 from models import (
     db, User, DoctorProfile, Review, Availability, 
-    Medicine, Pharmacy, PharmacyStock, VIPConsult, VIPConsultAssignment
+    Medicine, Pharmacy, PharmacyStock, VIPConsult,
+    DAYS, MINUTES_PER_DAY, minute_of_week, availability_overlaps, available_doctor_slots
 )
 from config import Config
+from stock_index import find_basket
+from distance import rank_by_distance
+from search import normalize, suggest_medicines
+from doctor_search import search_doctors, search_terms
+from matching import assign_doctors
+from storage import storage
+from cache import cache, cached, table_tag
+from identity import fresh_user, user_tag
+from singleflight import search_flight
+from pagination import encode_cursor, decode_cursor, check_cursor, keyset_after, order_by_clauses
+from stock_import import FORMATS, detect_format, import_stock, open_text
 
 bp = Blueprint('routes', __name__)
 
@@ -26,31 +38,6 @@ def vip_required(f):
     return decorated_function
 
 
-def haversine_distance(lat1, lon1, lat2, lon2):
-    """
-    Calculate the great circle distance between two points on Earth (in km)
-    using the Haversine formula
-    """
-    # Radius of Earth in kilometers
-    R = 6371.0
-    
-    # Convert to radians
-    lat1_rad = math.radians(lat1)
-    lon1_rad = math.radians(lon1)
-    lat2_rad = math.radians(lat2)
-    lon2_rad = math.radians(lon2)
-    
-    # Haversine formula
-    dlat = lat2_rad - lat1_rad
-    dlon = lon2_rad - lon1_rad
-    
-    a = math.sin(dlat / 2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlon / 2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    
-    distance = R * c
-    return distance
-
-
 def allowed_file(filename):
     """Check if file extension is allowed"""
     return '.' in filename and \
@@ -144,6 +131,7 @@ def login():
         user = User.query.filter_by(email=email).first()
         
         if user and user.check_password(password):
+            db.session.commit()  # Saves the hash if check_password upgraded it to the current policy
             login_user(user, remember=request.form.get('remember') == 'on')
             next_page = request.args.get('next')
             flash(f'Welcome back, {user.name}!', 'success')
@@ -169,14 +157,42 @@ def doctors():
     return render_template('doctors.html')
 
 
-@bp.route('/api/doctors')
-def api_doctors():
-    """API endpoint for doctor filtering"""
-    specialty_filter = request.args.get('specialty', '')
-    min_rating = request.args.get('min_rating', type=float)
-    
-    # Query doctors with their profiles
-    query = DoctorProfile.query.join(User)
+# Columns /api/doctors can return (fields=...); bio is fetched just long enough to truncate
+DOCTOR_FIELDS = {
+    'id': DoctorProfile.id,
+    'name': User.name,
+    'specialty': DoctorProfile.specialty,
+    'average_rating': DoctorProfile.average_rating,
+    'bio': func.substr(DoctorProfile.bio, 1, 101),
+    'address': DoctorProfile.address
+}
+
+# Keyset orderings for /api/doctors (sort=...), each ending in a unique tiebreaker
+DOCTOR_SORTS = {
+    'rating': [(DoctorProfile.average_rating, True), (DoctorProfile.id, False)],
+    'name': [(User.name, False), (DoctorProfile.id, False)]
+}
+
+
+def format_doctor_field(field, value):
+    """Shape a raw column value for the /api/doctors response"""
+    if field == 'average_rating':
+        return round(value, 1)
+    if field == 'bio':
+        return value[:100] + '...' if value and len(value) > 100 else value or ''
+    if field == 'address':
+        return value or ''
+    return value
+
+
+def fetch_doctor_page(specialty_filter, min_rating, sort, limit, after, fields):
+    """One page of /api/doctors results as plain data"""
+    # Fetch only the requested columns plus the sort key, as plain rows
+    ordering = DOCTOR_SORTS[sort]
+    query = db.session.query(
+        *[DOCTOR_FIELDS[f].label(f) for f in fields],
+        *[column.label(f'sort_key_{i}') for i, (column, _) in enumerate(ordering)]
+    ).select_from(DoctorProfile).join(User, DoctorProfile.user_id == User.id)
     
     if specialty_filter:
         query = query.filter(DoctorProfile.specialty.ilike(f'%{specialty_filter}%'))
@@ -184,35 +200,182 @@ def api_doctors():
     if min_rating is not None:
         query = query.filter(DoctorProfile.average_rating >= min_rating)
     
-    doctors = query.all()
+    if after is not None:
+        query = query.filter(keyset_after(ordering, after))
+    
+    rows = query.order_by(*order_by_clauses(ordering)).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
     
     # Format response
-    doctors_data = []
-    for doctor in doctors:
-        doctors_data.append({
-            'id': doctor.id,
-            'name': doctor.user.name,
-            'specialty': doctor.specialty,
-            'average_rating': round(doctor.average_rating, 1),
-            'bio': doctor.bio[:100] + '...' if doctor.bio and len(doctor.bio) > 100 else doctor.bio or '',
-            'address': doctor.address or ''
-        })
+    doctors_data = [
+        {field: format_doctor_field(field, value) for field, value in zip(fields, row)}
+        for row in rows
+    ]
+    
+    return {
+        'doctors': doctors_data,
+        'next_cursor': encode_cursor(rows[-1][len(fields):]) if has_more else None
+    }
+
+
+@cached('specialties', tags=[table_tag(DoctorProfile)])
+def get_specialties():
+    """Distinct doctor specialties"""
+    specialties = db.session.query(DoctorProfile.specialty).distinct().all()
+    return [s[0] for s in specialties]
+
+
+@bp.route('/api/doctors')
+def api_doctors():
+    """API endpoint for doctor filtering, keyset-paginated"""
+    specialty_filter = request.args.get('specialty', '')
+    min_rating = request.args.get('min_rating', type=float)
+    sort = request.args.get('sort', 'rating')
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+    cursor = request.args.get('cursor')
+    fields = [f for f in request.args.get('fields', '').split(',') if f] or list(DOCTOR_FIELDS)
+    
+    if sort not in DOCTOR_SORTS:
+        return jsonify({'error': f'Unknown sort "{sort}". Use one of: {", ".join(DOCTOR_SORTS)}.'}), 400
+    unknown = [f for f in fields if f not in DOCTOR_FIELDS]
+    if unknown:
+        return jsonify({'error': f'Unknown fields: {", ".join(unknown)}.'}), 400
+    
+    after = None
+    if cursor:
+        try:
+            after = check_cursor(DOCTOR_SORTS[sort], decode_cursor(cursor))
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor.'}), 400
+    
+    # Doctor listings change with profiles, user names and (via ratings) reviews
+    key = f'doctors:{specialty_filter}:{min_rating}:{sort}:{limit}:{cursor}:{",".join(fields)}'
+    page = cache.get_or_set(
+        key,
+        lambda: fetch_doctor_page(specialty_filter, min_rating, sort, limit, after, fields),
+        tags=[table_tag(DoctorProfile), table_tag(User), table_tag(Review)]
+    )
+    return jsonify(page)
+
+
+def fetch_doctor_search(term, limit, fields):
+    """Full-text /api/doctors/search results, most relevant first"""
+    doctor_ids = search_doctors(term, limit)
+    if not doctor_ids:
+        return {'doctors': []}
+    rows = db.session.query(
+        DoctorProfile.id, *[DOCTOR_FIELDS[f].label(f) for f in fields]
+    ).select_from(DoctorProfile).join(User, DoctorProfile.user_id == User.id).filter(
+        DoctorProfile.id.in_(doctor_ids)
+    ).all()
+    by_id = {row[0]: row[1:] for row in rows}
+    return {
+        'doctors': [
+            {field: format_doctor_field(field, value) for field, value in zip(fields, by_id[doctor_id])}
+            for doctor_id in doctor_ids if doctor_id in by_id
+        ]
+    }
+
+
+@bp.route('/api/doctors/search')
+def api_search_doctors():
+    """Ranked full-text search over doctor names, specialties, addresses and bios"""
+    term = request.args.get('q', '').strip()
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+    fields = [f for f in request.args.get('fields', '').split(',') if f] or list(DOCTOR_FIELDS)
+    
+    unknown = [f for f in fields if f not in DOCTOR_FIELDS]
+    if unknown:
+        return jsonify({'error': f'Unknown fields: {", ".join(unknown)}.'}), 400
+    if not search_terms(term):
+        return jsonify({'error': 'Please provide a search term (q).'}), 400
+    
+    key = f'doctor_search:{" ".join(search_terms(term))}:{limit}:{",".join(fields)}'
+    result = cache.get_or_set(
+        key,
+        lambda: fetch_doctor_search(term, limit, fields),
+        tags=[table_tag(DoctorProfile), table_tag(User), table_tag(Review)]
+    )
+    return jsonify(result)
+
+
+def parse_week_minute(value):
+    """Minute of the week for 'Tuesday 14:30' or an ISO datetime; now (server time) when empty"""
+    if not value:
+        moment = datetime.now()
+        return moment.weekday() * MINUTES_PER_DAY + moment.hour * 60 + moment.minute
     
-    return jsonify(doctors_data)
+    parts = value.replace(',', ' ').split()
+    if len(parts) == 2 and parts[0].capitalize() in DAYS:
+        return minute_of_week(parts[0].capitalize(), datetime.strptime(parts[1], '%H:%M').time())
+    moment = datetime.fromisoformat(value)
+    return moment.weekday() * MINUTES_PER_DAY + moment.hour * 60 + moment.minute
+
+
+def format_week_minute(minute):
+    """'HH:MM' for a minute of the week"""
+    minute_of_day = minute % MINUTES_PER_DAY
+    return f'{minute_of_day // 60:02d}:{minute_of_day % 60:02d}'
+
+
+def fetch_available_doctors(minute, specialty_filter, limit):
+    """Doctors with a slot covering a minute of the week, best rated first"""
+    slots = available_doctor_slots(minute).subquery()
+    query = db.session.query(
+        DoctorProfile.id, User.name, DoctorProfile.specialty, DoctorProfile.average_rating, slots.c.end_minute
+    ).select_from(slots).join(DoctorProfile, DoctorProfile.id == slots.c.doctor_id).join(
+        User, DoctorProfile.user_id == User.id
+    )
+    if specialty_filter:
+        query = query.filter(DoctorProfile.specialty.ilike(f'%{specialty_filter}%'))
+    
+    rows = query.order_by(DoctorProfile.average_rating.desc(), DoctorProfile.id).limit(limit).all()
+    return {
+        'at': {'day': DAYS[minute // MINUTES_PER_DAY], 'time': format_week_minute(minute)},
+        'doctors': [{
+            'id': doctor_id,
+            'name': name,
+            'specialty': specialty,
+            'average_rating': round(rating, 1),
+            'available_until': format_week_minute(end_minute)
+        } for doctor_id, name, specialty, rating, end_minute in rows]
+    }
+
+
+@bp.route('/api/doctors/available')
+def api_available_doctors():
+    """Doctors available at a given time (?at=Tuesday 14:30 or an ISO datetime; default now)"""
+    specialty_filter = request.args.get('specialty', '')
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+    try:
+        minute = parse_week_minute(request.args.get('at', '').strip())
+    except ValueError:
+        return jsonify({'error': 'Invalid "at". Use e.g. "Tuesday 14:30" or an ISO datetime.'}), 400
+    
+    key = f'available_doctors:{minute}:{specialty_filter}:{limit}'
+    result = cache.get_or_set(
+        key,
+        lambda: fetch_available_doctors(minute, specialty_filter, limit),
+        tags=[table_tag(Availability), table_tag(DoctorProfile), table_tag(User), table_tag(Review)]
+    )
+    return jsonify(result)
 
 
 @bp.route('/api/specialties')
 def api_specialties():
     """Get list of all specialties"""
-    specialties = db.session.query(DoctorProfile.specialty).distinct().all()
-    return jsonify([s[0] for s in specialties])
+    return jsonify(get_specialties())
 
 
 @bp.route('/doctor/<int:doctor_id>')
 def doctor_profile(doctor_id):
     """Individual doctor profile page"""
-    doctor = DoctorProfile.query.get_or_404(doctor_id)
-    reviews = Review.query.filter_by(doctor_id=doctor_id).order_by(Review.created_at.desc()).all()
+    doctor = DoctorProfile.query.options(joinedload(DoctorProfile.user)).filter_by(id=doctor_id).first_or_404()
+    reviews = Review.query.options(joinedload(Review.patient)).filter_by(
+        doctor_id=doctor_id
+    ).order_by(Review.created_at.desc()).all()
+    availabilities = doctor.availabilities.all()
     
     # Check if current user has already reviewed this doctor
     can_review = False
@@ -223,7 +386,8 @@ def doctor_profile(doctor_id):
         ).first()
         can_review = existing_review is None
     
-    return render_template('profile.html', doctor=doctor, reviews=reviews, can_review=can_review)
+    return render_template('profile.html', doctor=doctor, reviews=reviews,
+                           availabilities=availabilities, can_review=can_review)
 
 
 @bp.route('/doctor/<int:doctor_id>/review', methods=['POST'])
@@ -259,13 +423,10 @@ def submit_review(doctor_id):
         comment=comment
     )
     
+    # Doctor's rating aggregates are updated in the same transaction
     db.session.add(review)
     db.session.commit()
     
-    # Update doctor's average rating
-    doctor = DoctorProfile.query.get(doctor_id)
-    doctor.update_average_rating()
-    
     flash('Review submitted successfully!', 'success')
     return redirect(url_for('routes.doctor_profile', doctor_id=doctor_id))
 
@@ -273,8 +434,75 @@ def submit_review(doctor_id):
 @bp.route('/medicines')
 def medicines():
     """Medicine finder page"""
-    medicines = Medicine.query.all()
-    return render_template('medicines.html', medicines=medicines)
+    # The page searches through the API, so no medicine rows are needed here
+    return render_template('medicines.html')
+
+
+@bp.route('/api/medicines/suggest')
+def api_medicine_suggest():
+    """Autocomplete medicine names, best matches first"""
+    term = request.args.get('q', '').strip()
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 50)
+    
+    if not term:
+        return jsonify([])
+    
+    return jsonify([{'id': medicine_id, 'name': name} for medicine_id, name in suggest_medicines(term, limit)])
+
+
+def request_origin(data):
+    """User location from a JSON body, else a default location (e.g., Paris)"""
+    try:
+        return float(data['lat']), float(data['lng'])
+    except (KeyError, ValueError, TypeError):
+        return 48.8566, 2.3522  # Fallback if missing or invalid coords
+
+
+def stock_quantities(medicine_ids, pharmacy_ids):
+    """{(pharmacy_id, medicine_id): quantity} for the given pharmacies and medicines"""
+    rows = db.session.query(PharmacyStock.pharmacy_id, PharmacyStock.medicine_id, PharmacyStock.quantity).filter(
+        PharmacyStock.pharmacy_id.in_(pharmacy_ids), PharmacyStock.medicine_id.in_(medicine_ids)
+    )
+    return {(pharmacy_id, medicine_id): quantity for pharmacy_id, medicine_id, quantity in rows}
+
+
+def find_medicine_pharmacies(medicine_name, origin_lat, origin_lng):
+    """Best medicine match for a name and the nearest pharmacies stocking it, as plain data"""
+    # Find the best-ranked medicine match
+    matches = suggest_medicines(medicine_name, limit=1)
+    medicine = db.session.get(Medicine, matches[0][0]) if matches else None
+    if not medicine:
+        return None
+    
+    # Limit to top 10 results for faster loading; the inverted stock index answers "who has it"
+    nearest = find_basket([medicine.id], origin_lat, origin_lng, k=10)
+    pharmacy_ids = [pharmacy_id for _, pharmacy_id, _ in nearest]
+    pharmacies_by_id = {pharmacy.id: pharmacy for pharmacy in Pharmacy.query.filter(Pharmacy.id.in_(pharmacy_ids))}
+    quantities = stock_quantities([medicine.id], pharmacy_ids)
+    
+    results = []
+    for distance, pharmacy_id, _ in nearest:
+        pharmacy = pharmacies_by_id.get(pharmacy_id)
+        if pharmacy is None:
+            continue  # Deleted since the index was built (e.g. by another worker)
+        results.append({
+            'pharmacy_id': pharmacy.id,
+            'pharmacy_name': pharmacy.name,
+            'address': pharmacy.address,
+            'quantity': quantities.get((pharmacy_id, medicine.id), 0),
+            'distance': round(distance, 2),
+            'lat': pharmacy.lat,
+            'lng': pharmacy.lng
+        })
+    
+    return {
+        'medicine': {
+            'id': medicine.id,
+            'name': medicine.name,
+            'description': medicine.description
+        },
+        'pharmacies': results
+    }
 
 
 @bp.route('/api/search-medicines', methods=['POST'])
@@ -282,92 +510,147 @@ def search_medicines():
     """Search for medicines and return nearby pharmacies"""
     data = request.get_json()
     medicine_name = data.get('medicine_name', '').strip()
-    user_lat = data.get('lat')
-    user_lng = data.get('lng')
     
     if not medicine_name:
         return jsonify({'error': 'Please enter a medicine name.'}), 400
     
-    # Find medicine
-    medicine = Medicine.query.filter(Medicine.name.ilike(f'%{medicine_name}%')).first()
+    user_lat, user_lng = request_origin(data)
     
-    if not medicine:
+    # Identical searches from the same map cell share one computation and, briefly, its result
+    origin_lat, origin_lng = user_lat, user_lng
+    cell = current_app.config['SEARCH_COALESCE_CELL_DEGREES']
+    if cell:
+        origin_lat = (math.floor(user_lat / cell) + 0.5) * cell
+        origin_lng = (math.floor(user_lng / cell) + 0.5) * cell
+    key = f'medicine_search:{normalize(medicine_name)}:{origin_lat:.6f}:{origin_lng:.6f}'
+    result = cache.get_or_set(
+        key,
+        lambda: search_flight.do(key, lambda: find_medicine_pharmacies(medicine_name, origin_lat, origin_lng)),
+        ttl=current_app.config['SEARCH_RESULT_TTL'],
+        tags=[table_tag(Medicine), table_tag(PharmacyStock), table_tag(Pharmacy)]
+    )
+    
+    if result is not None and cell:
+        # Distances were measured from the cell's center; redo them from the user's own position
+        cached_pharmacies = result['pharmacies']
+        ranked = rank_by_distance(
+            user_lat, user_lng, range(len(cached_pharmacies)),
+            [pharmacy['lat'] for pharmacy in cached_pharmacies], [pharmacy['lng'] for pharmacy in cached_pharmacies],
+            k=len(cached_pharmacies)
+        )
+        pharmacies = [dict(cached_pharmacies[i], distance=round(distance, 2)) for distance, i in ranked]
+        result = dict(result, pharmacies=pharmacies)
+    
+    if result is None:
         return jsonify({
             'error': f'Medicine "{medicine_name}" not found in our database. Please try another name.'
         }), 404
-    
-    # Find pharmacies with stock
-    stocks = PharmacyStock.query.filter_by(
-        medicine_id=medicine.id
-    ).filter(PharmacyStock.quantity > 0).all()
-    
-    if not stocks:
+    if not result['pharmacies']:
         return jsonify({
             'error': f'Medicine "{medicine_name}" is not currently in stock at any nearby pharmacy.'
         }), 404
+    return jsonify(result)
+
+
+@bp.route('/api/search-basket', methods=['POST'])
+def search_basket():
+    """Nearest pharmacies stocking a whole prescription (medicine ids or names), then the best partial matches"""
+    data = request.get_json(silent=True) or {}
+    requested = data.get('medicines')
+    try:
+        limit = min(max(int(data.get('limit', 10)), 1), 50)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid limit.'}), 400
     
-    results = []
+    if not isinstance(requested, list) or not requested:
+        return jsonify({'error': 'Please provide a list of medicines (ids or names).'}), 400
+    if len(requested) > current_app.config['BASKET_MAX_MEDICINES']:
+        return jsonify({'error': f'At most {current_app.config["BASKET_MAX_MEDICINES"]} medicines per basket.'}), 400
+    # JSON true/false would otherwise pass as the ids 1 and 0
+    if not all(isinstance(item, str) or (isinstance(item, int) and not isinstance(item, bool)) for item in requested):
+        return jsonify({'error': 'Medicines must be given as ids or names.'}), 400
     
-    for stock in stocks:
-        pharmacy = stock.pharmacy
-        
-        # Calculate distance only if user location provided
-        distance = None
-        if user_lat is not None and user_lng is not None:
-            try:
-                distance = haversine_distance(
-                    float(user_lat), float(user_lng),
-                    pharmacy.lat, pharmacy.lng
-                )
-            except (ValueError, TypeError):
-                distance = None  # Fallback if invalid coords
+    # Resolve names with the same best-match lookup as single searches; ids are taken as given
+    ids = {item for item in requested if isinstance(item, int)}
+    medicines = {medicine.id: medicine for medicine in Medicine.query.filter(Medicine.id.in_(ids))} if ids else {}
+    basket, not_found = [], []
+    for item in requested:
+        if isinstance(item, int):
+            medicine_id = item if item in medicines else None
+        else:
+            matches = suggest_medicines(item.strip(), limit=1)
+            medicine_id = matches[0][0] if matches else None
+        if medicine_id is None:
+            not_found.append(item)
+        elif medicine_id not in basket:
+            basket.append(medicine_id)
     
+    if not basket:
+        return jsonify({'error': 'None of these medicines are in our database.', 'not_found': not_found}), 404
+    missing_ids = [medicine_id for medicine_id in basket if medicine_id not in medicines]
+    if missing_ids:
+        medicines.update((medicine.id, medicine) for medicine in Medicine.query.filter(Medicine.id.in_(missing_ids)))
+    
+    origin_lat, origin_lng = request_origin(data)
+    ranked = find_basket(basket, origin_lat, origin_lng, k=limit)
+    pharmacy_ids = [pharmacy_id for _, pharmacy_id, _ in ranked]
+    pharmacies_by_id = {pharmacy.id: pharmacy for pharmacy in Pharmacy.query.filter(Pharmacy.id.in_(pharmacy_ids))}
+    quantities = stock_quantities(basket, pharmacy_ids)
+    
+    results = []
+    for distance, pharmacy_id, covered in ranked:
+        pharmacy = pharmacies_by_id.get(pharmacy_id)
+        if pharmacy is None:
+            continue  # Deleted since the index was built (e.g. by another worker)
+        stock = {medicine_id: quantities.get((pharmacy_id, medicine_id), 0) for medicine_id in basket}
         results.append({
             'pharmacy_id': pharmacy.id,
             'pharmacy_name': pharmacy.name,
             'address': pharmacy.address,
-            'quantity': stock.quantity,
-            'distance': round(distance, 2) if distance is not None else None,
+            'distance': round(distance, 2),
             'lat': pharmacy.lat,
-            'lng': pharmacy.lng
+            'lng': pharmacy.lng,
+            'coverage': covered,
+            'complete': covered == len(basket),
+            'quantities': {str(medicine_id): quantity for medicine_id, quantity in stock.items() if quantity > 0},
+            'missing': [medicine_id for medicine_id, quantity in stock.items() if quantity <= 0]
         })
     
-    # Sort by distance if location provided, else by default location
-    if user_lat is not None and user_lng is not None:
-        results.sort(key=lambda x: x['distance'] if x['distance'] is not None else float('inf'))
-    else:
-        # Default location (e.g., Paris) if no user location
-        default_lat, default_lng = 48.8566, 2.3522
-        for result in results:
-            if result['distance'] is None:
-                result['distance'] = round(haversine_distance(
-                    default_lat, default_lng,
-                    result['lat'], result['lng']
-                ), 2)
-        results.sort(key=lambda x: x['distance'])
-    
-    # Limit to top 10 results for faster loading
-    results = results[:10]
-    
     return jsonify({
-        'medicine': {
-            'id': medicine.id,
-            'name': medicine.name,
-            'description': medicine.description
-        },
+        'medicines': [{'id': medicine_id, 'name': medicines[medicine_id].name} for medicine_id in basket],
+        'not_found': not_found,
         'pharmacies': results
     })
 
 
+VIP_CONSULT_LIMITS = {'basic': 5, 'premium': 10}  # Per year; unlimited has no limit
+
+
+def claim_vip_consult(user):
+    """
+    Count one consult against the user's plan with a single guarded UPDATE, so
+    concurrent requests (in any worker) cannot take it past the limit.
+    Returns False if the limit was already reached.
+    """
+    statement = update(User).where(User.id == user.id, User.vip_plan == user.vip_plan).values(
+        vip_consults_used=User.vip_consults_used + 1
+    )
+    limit = VIP_CONSULT_LIMITS.get(user.vip_plan)
+    if limit is not None:
+        statement = statement.where(User.vip_consults_used < limit)
+    return db.session.execute(statement.execution_options(synchronize_session=False)).rowcount == 1
+
+
 @bp.route('/vip-consult', methods=['GET', 'POST'])
 @vip_required
 def vip_consult():
     """VIP consultation request form"""
-    # Check consult limit
-    if current_user.vip_plan == 'basic' and current_user.vip_consults_used >= 5:
+    # Check consult limit (against the current row, not the cached login identity)
+    user = fresh_user(current_user)
+    if user.vip_plan == 'basic' and user.vip_consults_used >= 5:
         flash('You have reached your Basic plan limit of 5 consultations per year. Upgrade your plan.', 'warning')
         return redirect(url_for('routes.upgrade'))
-    elif current_user.vip_plan == 'premium' and current_user.vip_consults_used >= 10:
+    elif user.vip_plan == 'premium' and user.vip_consults_used >= 10:
         flash('You have reached your Premium plan limit of 10 consultations per year. Upgrade your plan.', 'warning')
         return redirect(url_for('routes.upgrade'))
     # Unlimited has no limit
@@ -380,23 +663,22 @@ def vip_consult():
             flash('Please fill in all required fields.', 'danger')
             return render_template('vip_consult.html')
         
-        # Handle file upload
+        # Another request may have used the last consult since the check above
+        if not claim_vip_consult(user):
+            db.session.rollback()
+            flash('You have reached your plan limit of consultations per year. Upgrade your plan.', 'warning')
+            return redirect(url_for('routes.upgrade'))
+        
+        # Handle file upload (streamed to content-addressed storage while the form is parsed)
         file_path = None
         if 'file' in request.files:
             file = request.files['file']
             if file and file.filename and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                # Add timestamp to avoid conflicts
-                import time
-                filename = f"{int(time.time())}_{filename}"
-                file_path = os.path.join(Config.UPLOAD_FOLDER, filename)
-                os.makedirs(Config.UPLOAD_FOLDER, exist_ok=True)
-                file.save(file_path)
-                file_path = f"uploads/{filename}"
+                file_path = storage.save(file).key
         
         # Create VIP consult
         vip_consult = VIPConsult(
-            patient_id=current_user.id,
+            patient_id=user.id,
             description=description,
             specialty=specialty,
             file_path=file_path,
@@ -406,46 +688,41 @@ def vip_consult():
         db.session.add(vip_consult)
         db.session.flush()  # Get the ID
         
-        # Find 5 random doctors with rating > 3 and matching specialty
-        matching_doctors = DoctorProfile.query.filter(
-            DoctorProfile.average_rating > 3.0,
-            DoctorProfile.specialty.ilike(f'%{specialty}%')
-        ).all()
-        
-        # If not enough matching specialty, include all doctors with rating > 3
-        if len(matching_doctors) < 5:
-            all_qualified = DoctorProfile.query.filter(
-                DoctorProfile.average_rating > 3.0
-            ).all()
-            matching_doctors = all_qualified
-        
-        # Select up to 5 random doctors
-        selected_doctors = random.sample(matching_doctors, min(5, len(matching_doctors)))
-        
-        # Create assignments
-        for doctor in selected_doctors:
-            assignment = VIPConsultAssignment(
-                consult_id=vip_consult.id,
-                doctor_id=doctor.id,
-                status='pending'
-            )
-            db.session.add(assignment)
-        
+        # Assign up to 5 doctors rated above the threshold, preferring the requested specialty
+        assign_doctors(vip_consult, k=5)
         db.session.commit()
+        # The counter was updated in SQL, outside the session's change tracking
+        cache.invalidate(user_tag(user.id), table_tag(User))
         
         flash('VIP consultation request submitted! Doctors will be notified.', 'success')
         
-        # After successful submission
-        current_user.vip_consults_used += 1
-        db.session.commit()
-        
         return redirect(url_for('routes.vip_consult'))
     
     # Get specialties for dropdown
-    specialties = db.session.query(DoctorProfile.specialty).distinct().all()
-    specialty_list = [s[0] for s in specialties]
+    return render_template('vip_consult.html', specialties=get_specialties())
+
+
+@bp.route('/vip-consult/<int:consult_id>/file')
+@login_required
+def vip_consult_file(consult_id):
+    """Download a consult's attachment (patient, assigned doctors and admins only)"""
+    consult = VIPConsult.query.get_or_404(consult_id)
+    if not consult.file_path:
+        abort(404)
+    
+    allowed = current_user.role == 'admin' or consult.patient_id == current_user.id
+    if not allowed and current_user.doctor_profile:
+        allowed = consult.assignments.filter_by(doctor_id=current_user.doctor_profile.id).first() is not None
+    if not allowed:
+        abort(403)
     
-    return render_template('vip_consult.html', specialties=specialty_list)
+    extension = consult.file_path.rpartition('.')[2] if '.' in consult.file_path else 'bin'
+    download_name = f'consult-{consult.id}.{extension}'
+    if consult.file_path.startswith('uploads/'):
+        # Uploaded before content-addressed storage, still under static/
+        return send_from_directory(current_app.static_folder, consult.file_path,
+                                   download_name=download_name, conditional=True)
+    return storage.send(consult.file_path, download_name)
 
 
 @bp.route('/upgrade', methods=['GET', 'POST'])
@@ -469,9 +746,10 @@ def upgrade():
         
         # Special code bypass or payment success
         if vip_code == 'essths' or payment_success:
-            current_user.is_vip = True
-            current_user.vip_plan = plan
-            current_user.vip_consults_used = 0  # Reset counter
+            user = fresh_user(current_user)  # Write over the current row, not the cached identity
+            user.is_vip = True
+            user.vip_plan = plan
+            user.vip_consults_used = 0  # Reset counter
             db.session.commit()
             flash(f'Congratulations! You are now a VIP member with {plans[plan]["name"]} plan.', 'success')
             return redirect(url_for('routes.index'))
@@ -494,77 +772,157 @@ def admin_required(f):
     return decorated_function
 
 
+def compute_admin_stats():
+    """All dashboard counts in a single round-trip"""
+    def total(model):
+        return select(func.count()).select_from(model).scalar_subquery()
+    
+    consults = select(
+        func.count().label('total'),
+        func.count().filter(VIPConsult.status == 'pending').label('pending')
+    ).select_from(VIPConsult).subquery()
+    
+    row = db.session.execute(select(
+        total(User).label('total_users'),
+        total(DoctorProfile).label('total_doctors'),
+        total(Medicine).label('total_medicines'),
+        total(Pharmacy).label('total_pharmacies'),
+        total(Review).label('total_reviews'),
+        consults.c.total.label('total_vip_consults'),
+        consults.c.pending.label('vip_pending')
+    )).one()
+    return dict(row._mapping)
+
+
 @bp.route('/admin')
 def admin_dashboard():
     """Admin dashboard overview"""
-    users = User.query.all()
-    doctors = DoctorProfile.query.all()
-    medicines = Medicine.query.all()
-    pharmacies = Pharmacy.query.all()
-    reviews = Review.query.all()
-    vip_consults = VIPConsult.query.all()
-    
-    stats = {
-        'total_users': len(users),
-        'total_doctors': len(doctors),
-        'total_medicines': len(medicines),
-        'total_pharmacies': len(pharmacies),
-        'total_reviews': len(reviews),
-        'total_vip_consults': len(vip_consults),
-        'vip_pending': len([v for v in vip_consults if v.status == 'pending'])
-    }
+    # Counts only; each tab loads its own rows
+    stats = cache.get_or_set(
+        'admin_stats', compute_admin_stats,
+        ttl=current_app.config['ADMIN_STATS_TTL'],
+        tags=[table_tag(model) for model in (User, DoctorProfile, Medicine, Pharmacy, Review, VIPConsult)]
+    )
     
-    return render_template('admin.html', 
-                         users=users, 
-                         doctors=doctors, 
-                         medicines=medicines, 
-                         pharmacies=pharmacies, 
-                         reviews=reviews,
-                         vip_consults=vip_consults,
-                         stats=stats,
-                         active_tab='overview')
+    return render_template('admin.html', stats=stats, active_tab='overview')
+
+
+def admin_page(model, sort_columns, search_columns, query=None):
+    """
+    One keyset-paginated page of an admin table, sorted by ?sort=&dir= and
+    filtered by ?q= across search_columns
+    """
+    sort = request.args.get('sort', 'id')
+    if sort not in sort_columns:
+        sort = 'id'
+    descending = request.args.get('dir') == 'desc'
+    term = request.args.get('q', '').strip()
+    cursor = request.args.get('cursor')
+    limit = current_app.config['ADMIN_PAGE_SIZE']
+    
+    ordering = [(sort_columns[sort], descending)]
+    if sort != 'id':
+        ordering.append((model.id, descending))  # Unique tiebreaker
+    
+    query = query if query is not None else model.query
+    if term:
+        query = query.filter(or_(*[column.ilike(f'%{term}%') for column in search_columns]))
+    if cursor:
+        try:
+            query = query.filter(keyset_after(ordering, decode_cursor(cursor)))
+        except ValueError:
+            abort(400)
+    
+    rows = query.add_columns(*[column for column, _ in ordering]).order_by(
+        *order_by_clauses(ordering)
+    ).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    
+    return {
+        'items': [row[0] for row in rows],
+        'next_cursor': encode_cursor(rows[-1][1:]) if has_more else None,
+        'cursor': cursor,
+        'sort': sort,
+        'dir': 'desc' if descending else 'asc',
+        'q': term
+    }
 
 
 @bp.route('/admin/users')
 def admin_users():
     """Manage users"""
-    users = User.query.all()
-    return render_template('admin.html', users=users, active_tab='users')
+    page = admin_page(
+        User,
+        {'id': User.id, 'name': User.name, 'email': User.email, 'role': User.role},
+        [User.name, User.email]
+    )
+    return render_template('admin.html', users=page['items'], page=page, active_tab='users')
 
 
 @bp.route('/admin/doctors')
 def admin_doctors():
     """Manage doctors"""
-    doctors = DoctorProfile.query.all()
-    return render_template('admin.html', doctors=doctors, active_tab='doctors')
+    page = admin_page(
+        DoctorProfile,
+        {'id': DoctorProfile.id, 'name': User.name, 'specialty': DoctorProfile.specialty,
+         'rating': DoctorProfile.average_rating},
+        [User.name, DoctorProfile.specialty],
+        query=DoctorProfile.query.join(User).options(contains_eager(DoctorProfile.user))
+    )
+    return render_template('admin.html', doctors=page['items'], page=page, active_tab='doctors')
 
 
 @bp.route('/admin/medicines')
 def admin_medicines():
     """Manage medicines"""
-    medicines = Medicine.query.all()
-    return render_template('admin.html', medicines=medicines, active_tab='medicines')
+    page = admin_page(Medicine, {'id': Medicine.id, 'name': Medicine.name}, [Medicine.name])
+    return render_template('admin.html', medicines=page['items'], page=page, active_tab='medicines')
 
 
 @bp.route('/admin/pharmacies')
 def admin_pharmacies():
     """Manage pharmacies"""
-    pharmacies = Pharmacy.query.all()
-    return render_template('admin.html', pharmacies=pharmacies, active_tab='pharmacies')
+    page = admin_page(
+        Pharmacy,
+        {'id': Pharmacy.id, 'name': Pharmacy.name},
+        [Pharmacy.name, Pharmacy.address]
+    )
+    return render_template('admin.html', pharmacies=page['items'], page=page, active_tab='pharmacies')
 
 
 @bp.route('/admin/reviews')
 def admin_reviews():
     """Manage reviews"""
-    reviews = Review.query.all()
-    return render_template('admin.html', reviews=reviews, active_tab='reviews')
+    page = admin_page(
+        Review,
+        {'id': Review.id, 'rating': Review.rating},
+        [Review.comment],
+        query=Review.query.options(
+            joinedload(Review.doctor).joinedload(DoctorProfile.user),
+            joinedload(Review.patient)
+        )
+    )
+    return render_template('admin.html', reviews=page['items'], page=page, active_tab='reviews')
 
 
 @bp.route('/admin/vip-consults')
 def admin_vip_consults():
     """Manage VIP consults"""
-    vip_consults = VIPConsult.query.all()
-    return render_template('admin.html', vip_consults=vip_consults, active_tab='vip_consults')
+    page = admin_page(
+        VIPConsult,
+        {'id': VIPConsult.id, 'specialty': VIPConsult.specialty, 'status': VIPConsult.status},
+        [VIPConsult.specialty, VIPConsult.status, VIPConsult.description],
+        query=VIPConsult.query.options(joinedload(VIPConsult.patient))
+    )
+    return render_template('admin.html', vip_consults=page['items'], page=page, active_tab='vip_consults')
+
+
+@bp.route('/admin/cache-stats')
+@admin_required
+def admin_cache_stats():
+    """Response cache hit/miss counters, plus how many medicine searches were coalesced"""
+    return jsonify(dict(cache.info(), search_coalescing=dict(search_flight.stats)))
 
 
 @bp.route('/admin/user/<int:user_id>/make-admin', methods=['POST'])
@@ -599,8 +957,11 @@ def my_availability():
             flash('Please fill in all fields.', 'danger')
             return redirect(url_for('routes.my_availability'))
         
+        if day not in DAYS:
+            flash('Invalid day.', 'danger')
+            return redirect(url_for('routes.my_availability'))
+        
         try:
-            from datetime import datetime
             start_time = datetime.strptime(start_time_str, '%H:%M').time()
             end_time = datetime.strptime(end_time_str, '%H:%M').time()
             
@@ -608,12 +969,10 @@ def my_availability():
                 flash('Start time must be before end time.', 'danger')
                 return redirect(url_for('routes.my_availability'))
             
-            # Check for overlapping availability on the same day
-            existing = Availability.query.filter_by(doctor_id=doctor.id, day=day).all()
-            for avail in existing:
-                if (start_time < avail.end_time and end_time > avail.start_time):
-                    flash('Time slot overlaps with existing availability.', 'warning')
-                    return redirect(url_for('routes.my_availability'))
+            # Check for overlapping availability (one index seek on the doctor's minute-of-week intervals)
+            if availability_overlaps(doctor.id, minute_of_week(day, start_time), minute_of_week(day, end_time)):
+                flash('Time slot overlaps with existing availability.', 'warning')
+                return redirect(url_for('routes.my_availability'))
             
             availability = Availability(
                 doctor_id=doctor.id,
@@ -629,7 +988,7 @@ def my_availability():
         
         return redirect(url_for('routes.my_availability'))
     
-    availabilities = doctor.availabilities.order_by(Availability.day, Availability.start_time).all()
+    availabilities = doctor.availabilities.order_by(Availability.start_minute).all()
     return render_template('availability.html', availabilities=availabilities)
 
 
@@ -641,7 +1000,7 @@ def my_pharmacy():
         flash('Access denied. Pharmacy account required.', 'danger')
         return redirect(url_for('routes.index'))
     
-    pharmacy = Pharmacy.query.filter_by(user_id=current_user.id).first()
+    pharmacy = current_user.pharmacy
     if not pharmacy:
         flash('Pharmacy profile not found.', 'danger')
         return redirect(url_for('routes.index'))
@@ -674,15 +1033,69 @@ def my_pharmacy():
         return redirect(url_for('routes.my_pharmacy'))
     
     # Get current stock
-    stocks = PharmacyStock.query.filter_by(pharmacy_id=pharmacy.id).all()
+    stocks = PharmacyStock.query.options(joinedload(PharmacyStock.medicine)).filter_by(pharmacy_id=pharmacy.id).all()
     return render_template('pharmacy.html', pharmacy=pharmacy, stocks=stocks)
 
 
+def run_stock_import(pharmacy):
+    """Import stock for pharmacy from an uploaded file or the raw request body"""
+    upload = request.files.get('file')
+    if upload:
+        stream, filename, content_type = upload.stream, upload.filename, upload.mimetype
+    else:
+        stream, filename, content_type = request.stream, None, request.mimetype
+    
+    fmt = request.args.get('format') or detect_format(filename, content_type)
+    if fmt not in FORMATS:
+        return None, 'Unknown stock file format; use a .csv or .jsonl file'
+    return import_stock(pharmacy.id, open_text(stream), fmt), None
+
+
+@bp.route('/api/pharmacy/stock/import', methods=['POST'])
+@login_required
+def api_import_stock():
+    """Bulk upsert the current pharmacy's stock from CSV or JSON lines"""
+    pharmacy = current_user.pharmacy
+    if not pharmacy:
+        return jsonify({'error': 'Pharmacy account required'}), 403
+    
+    report, error = run_stock_import(pharmacy)
+    if error:
+        return jsonify({'error': error}), 400
+    return jsonify(report), 400 if 'error' in report else 200
+
+
+@bp.route('/my-pharmacy/import', methods=['POST'])
+@login_required
+def import_pharmacy_stock():
+    """Stock file upload from the pharmacy management page"""
+    pharmacy = current_user.pharmacy
+    if not pharmacy:
+        flash('Access denied. Pharmacy account required.', 'danger')
+        return redirect(url_for('routes.index'))
+    
+    if not request.files.get('file'):
+        flash('Please choose a stock file to import.', 'danger')
+        return redirect(url_for('routes.my_pharmacy'))
+    
+    report, error = run_stock_import(pharmacy)
+    if error:
+        flash(error, 'danger')
+        return redirect(url_for('routes.my_pharmacy'))
+    
+    flash(f"Stock import: {report['inserted']} added, {report['updated']} updated, "
+          f"{report['unchanged']} unchanged, {report['rejected']} rejected.",
+          'warning' if report['rejected'] or 'error' in report else 'success')
+    if 'error' in report:
+        flash(report['error'], 'danger')
+    return redirect(url_for('routes.my_pharmacy'))
+
+
 @bp.route('/pharmacy/<int:pharmacy_id>')
 def pharmacy_profile(pharmacy_id):
     """Individual pharmacy profile page"""
     pharmacy = Pharmacy.query.get_or_404(pharmacy_id)
-    stocks = PharmacyStock.query.filter_by(pharmacy_id=pharmacy_id).all()
+    stocks = PharmacyStock.query.options(joinedload(PharmacyStock.medicine)).filter_by(pharmacy_id=pharmacy_id).all()
     
     return render_template('pharmacy_profile.html', pharmacy=pharmacy, stocks=stocks)
 
@@ -708,7 +1121,7 @@ def my_profile():
             flash('Doctor profile created. Please update your information.', 'info')
             return redirect(url_for('routes.doctor_profile', doctor_id=doctor_profile.id))
     elif current_user.role == 'pharmacy':
-        pharmacy = Pharmacy.query.filter_by(user_id=current_user.id).first()
+        pharmacy = current_user.pharmacy
         if pharmacy:
             return redirect(url_for('routes.pharmacy_profile', pharmacy_id=pharmacy.id))
         else:
@@ -0,0 +1,271 @@
+import heapq
+import threading
+import time
+from array import array
+from bisect import bisect_left, insort
+from flask import current_app
+from sqlalchemy import event, func, text
+from sqlalchemy.orm import Session
+from models import db, Medicine, IndexVersion, ensure_index_version
+
+
+def normalize(term):
+    """Case-fold and collapse whitespace so lookups are case/spacing-insensitive"""
+    return ' '.join((term or '').casefold().split())
+
+
+def trigrams(term):
+    """Set of 3-character substrings of an already-normalized term"""
+    return {term[i:i + 3] for i in range(len(term) - 2)}
+
+
+class MedicineIndex:
+    """
+    In-memory prefix and trigram index over Medicine.name.
+
+    Names are kept in a sorted list for prefix lookups (bisect), a sorted list
+    of (word, name, id) entries for word-prefix lookups, and trigram posting lists for
+    substring lookups. Committed inserts, updates and deletes are applied
+    incrementally; a periodic row count/max id/version check triggers a
+    rebuild when another worker has changed the catalog.
+    """
+
+    def __init__(self):
+        self._names = {}      # id -> (normalized name, display name)
+        self._sorted = []     # sorted (normalized name, id)
+        self._words = []      # sorted (word, normalized name, id)
+        self._trigrams = {}   # trigram -> array of ids (compact posting list)
+        self._signature_at_build = None
+        self._built_at = None
+        self._lock = threading.RLock()
+
+    def invalidate(self):
+        """Mark the index stale so the next lookup rebuilds it"""
+        self._built_at = None
+
+    def _signature(self):
+        # The version catches renames, which leave the count and max id as they were
+        version = db.session.query(IndexVersion.version).filter(IndexVersion.name == 'medicines').scalar_subquery()
+        return tuple(db.session.query(func.count(Medicine.id), func.max(Medicine.id), version).one())
+
+    def rebuild(self):
+        """Load every medicine name from the database"""
+        signature = self._signature()
+        rows = db.session.query(Medicine.id, Medicine.name).all()
+        with self._lock:
+            self._names, self._sorted, self._words, self._trigrams = {}, [], [], {}
+            for medicine_id, name in rows:
+                self._insert(medicine_id, name, sort=False)
+            self._sorted.sort()
+            self._words.sort()
+            self._signature_at_build = signature
+            self._built_at = time.monotonic()
+
+    def _ensure_fresh(self):
+        ttl = current_app.config['MEDICINE_INDEX_TTL']
+        if self._built_at is not None and time.monotonic() - self._built_at <= ttl:
+            return
+        with self._lock:
+            if self._built_at is None:
+                self.rebuild()
+            elif time.monotonic() - self._built_at > ttl:
+                # Only reload when another worker has added, removed or renamed medicines
+                if self._signature() != self._signature_at_build:
+                    self.rebuild()
+                else:
+                    self._built_at = time.monotonic()
+
+    def _insert(self, medicine_id, name, sort=True):
+        key = normalize(name)
+        self._names[medicine_id] = (key, name)
+        add = insort if sort else list.append
+        add(self._sorted, (key, medicine_id))
+        for word in set(key.split()):
+            add(self._words, (word, key, medicine_id))
+        for trigram in trigrams(key):
+            postings = self._trigrams.get(trigram)
+            if postings is None:
+                postings = self._trigrams[trigram] = array('i')
+            postings.append(medicine_id)
+
+    def _delete(self, medicine_id):
+        entry = self._names.pop(medicine_id, None)
+        if entry is None:
+            return
+        key = entry[0]
+        entries = [(self._sorted, (key, medicine_id))] + [(self._words, (word, key, medicine_id))
+                                                         for word in set(key.split())]
+        for sorted_list, entry in entries:
+            position = bisect_left(sorted_list, entry)
+            if position < len(sorted_list) and sorted_list[position] == entry:
+                del sorted_list[position]
+        for trigram in trigrams(key):
+            postings = self._trigrams.get(trigram)
+            if postings is not None and medicine_id in postings:
+                postings.remove(medicine_id)
+                if not postings:
+                    del self._trigrams[trigram]
+
+    def apply(self, upserts, deletes):
+        """Apply committed changes: upserts is {id: name}, deletes a set of ids"""
+        if self._built_at is None:
+            return  # Not built yet; the first lookup loads everything
+        with self._lock:
+            for medicine_id in deletes | set(upserts):
+                self._delete(medicine_id)
+            for medicine_id, name in upserts.items():
+                self._insert(medicine_id, name)
+
+    @staticmethod
+    def _scan_prefix(sorted_list, prefix, limit, seen, out):
+        position = bisect_left(sorted_list, (prefix,))
+        while position < len(sorted_list) and len(out) < limit:
+            value, medicine_id = sorted_list[position][0], sorted_list[position][-1]
+            if not value.startswith(prefix):
+                break
+            if medicine_id not in seen:
+                seen.add(medicine_id)
+                out.append(medicine_id)
+            position += 1
+
+    def search(self, term, limit=10):
+        """
+        Return up to `limit` (id, name) matches ranked: exact name, name
+        prefix, word prefix, then any substring. Name tiers are alphabetical;
+        word-prefix matches are ordered by the matching word, then by name.
+        """
+        self._ensure_fresh()
+        query = normalize(term)
+        if not query or limit <= 0:
+            return []
+
+        with self._lock:
+            seen, ids = set(), []
+            self._scan_prefix(self._sorted, query, limit, seen, ids)
+            if ' ' not in query:
+                self._scan_prefix(self._words, query, limit, seen, ids)
+
+            if len(ids) < limit and len(query) >= 3:
+                postings = sorted((self._trigrams.get(t, ()) for t in trigrams(query)), key=len)
+                candidates = set(postings[0])
+                for other in postings[1:]:
+                    candidates.intersection_update(other)
+                candidates -= seen
+                names = self._names
+                matches = ((names[i][0], i) for i in candidates if query in names[i][0])
+                substring = heapq.nsmallest(limit - len(ids), matches)
+                ids += [medicine_id for _, medicine_id in substring]
+
+            return [(medicine_id, self._names[medicine_id][1]) for medicine_id in ids]
+
+
+medicine_index = MedicineIndex()
+
+
+def _like_escape(term):
+    """term with the LIKE wildcards % and _ escaped, backslash being the escape character"""
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def db_search(term, limit=10):
+    """
+    Ranked medicine lookup in the database, used when the in-memory index is
+    disabled. Uses the FTS5 trigram table on SQLite and an ILIKE served by the
+    pg_trgm index on PostgreSQL (a plain scan elsewhere).
+    """
+    query = normalize(term)
+    if not query:
+        return []
+    dialect = db.engine.dialect.name
+    escaped = _like_escape(query)  # User input: % and _ are literal characters
+    pattern = f'%{escaped}%'
+    if dialect == 'sqlite' and len(query) >= 3 and _has_sqlite_fts():
+        # An ESCAPE clause stops FTS5 from using the trigram index, so only add it when needed
+        escape = " ESCAPE '\\'" if escaped != query else ''
+        rows = db.session.execute(text(
+            f'SELECT m.id, m.name FROM medicines_fts f JOIN medicines m ON m.id = f.rowid '
+            f'WHERE f.name LIKE :pattern{escape} '
+            f'ORDER BY lower(m.name) <> :query, lower(m.name) NOT LIKE :prefix{escape}, m.name LIMIT :limit'
+        ), {'pattern': pattern, 'query': query, 'prefix': f'{escaped}%', 'limit': limit})
+    else:
+        # ILIKE is served by the pg_trgm GIN index on PostgreSQL
+        lowered = func.lower(Medicine.name)
+        rows = db.session.query(Medicine.id, Medicine.name).filter(
+            Medicine.name.ilike(pattern, escape='\\')
+        ).order_by(lowered != query, ~lowered.like(f'{escaped}%', escape='\\'), Medicine.name).limit(limit)
+    return [(medicine_id, name) for medicine_id, name in rows]
+
+
+def suggest_medicines(term, limit=10):
+    """Top `limit` medicines matching `term` as (id, name) pairs"""
+    if current_app.config['MEDICINE_INDEX_ENABLED']:
+        return medicine_index.search(term, limit)
+    return db_search(term, limit)
+
+
+def _has_sqlite_fts():
+    return db.session.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'medicines_fts'"
+    )).first() is not None
+
+
+def install_search_indexes(app):
+    """Create dialect-native search structures for medicine names if supported"""
+    engine = db.engine
+    with engine.begin() as connection:
+        ensure_index_version(connection, 'medicines')
+    if engine.dialect.name == 'sqlite':
+        statements = [
+            "CREATE VIRTUAL TABLE medicines_fts USING fts5("
+            "name, content='medicines', content_rowid='id', tokenize='trigram')",
+            "CREATE TRIGGER IF NOT EXISTS medicines_fts_ai AFTER INSERT ON medicines BEGIN "
+            "INSERT INTO medicines_fts(rowid, name) VALUES (new.id, new.name); END",
+            "CREATE TRIGGER IF NOT EXISTS medicines_fts_ad AFTER DELETE ON medicines BEGIN "
+            "INSERT INTO medicines_fts(medicines_fts, rowid, name) VALUES ('delete', old.id, old.name); END",
+            "CREATE TRIGGER IF NOT EXISTS medicines_fts_au AFTER UPDATE ON medicines BEGIN "
+            "INSERT INTO medicines_fts(medicines_fts, rowid, name) VALUES ('delete', old.id, old.name); "
+            "INSERT INTO medicines_fts(rowid, name) VALUES (new.id, new.name); END",
+            "INSERT INTO medicines_fts(medicines_fts) VALUES ('rebuild')",
+        ]
+        exists = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'medicines_fts'"
+    elif engine.dialect.name == 'postgresql':
+        statements = [
+            'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+            'CREATE INDEX IF NOT EXISTS ix_medicines_name_trgm ON medicines USING gin (name gin_trgm_ops)',
+        ]
+        exists = None
+    else:
+        return
+
+    try:
+        with engine.begin() as connection:
+            if exists and connection.execute(text(exists)).first():
+                return
+            for statement in statements:
+                connection.execute(text(statement))
+    except Exception as exc:  # e.g. SQLite built without FTS5, or no CREATE EXTENSION rights
+        app.logger.warning('Medicine search index not installed: %s', exc)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_medicine_changes(session, flush_context):
+    upserts, deletes = session.info.setdefault('medicine_index_changes', ({}, set()))
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, Medicine):
+            upserts[obj.id] = obj.name
+    for obj in session.deleted:
+        if isinstance(obj, Medicine):
+            upserts.pop(obj.id, None)
+            deletes.add(obj.id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_medicine_changes(session):
+    changes = session.info.pop('medicine_index_changes', None)
+    if changes and (changes[0] or changes[1]):
+        medicine_index.apply(*changes)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_medicine_changes(session):
+    session.info.pop('medicine_index_changes', None)
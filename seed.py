@@ -1,26 +1,77 @@
 from faker import Faker
 from app import create_app
-from models import db, User, DoctorProfile, Medicine, Pharmacy, PharmacyStock, Review, VIPConsult, VIPConsultAssignment, Availability
+from models import db, User, DoctorProfile, Medicine, Pharmacy, PharmacyStock, Review, VIPConsult, VIPConsultAssignment, Availability, DAYS, recompute_doctor_ratings
+from sqlalchemy import select
+from doctor_search import rebuild_doctor_search
+import argparse
 import random
 from datetime import datetime, time
+from time import perf_counter
 
 # Use English locale for English data, but with Tunisian context
 fake = Faker('en')
 
+SPECIALTIES = ['Cardiology', 'Dermatology', 'Neurology', 'Pediatrics', 'Orthopedics', 'General Medicine', 'Internal Medicine', 'Gynecology', 'Ophthalmology', 'Dentistry']
+
+# Common medicines for easier testing
+COMMON_MEDICINES = [
+    ("Aspirin", "Pain reliever and fever reducer."),
+    ("Ibuprofen", "Anti-inflammatory drug."),
+    ("Paracetamol", "Pain reliever and fever reducer."),
+    ("Amoxicillin", "Antibiotic for bacterial infections."),
+    ("Omeprazole", "Reduces stomach acid."),
+    ("Metformin", "Diabetes medication."),
+    ("Lisinopril", "Blood pressure medication."),
+    ("Simvastatin", "Cholesterol-lowering drug."),
+    ("Levothyroxine", "Thyroid hormone replacement."),
+    ("Albuterol", "Bronchodilator for asthma."),
+]
+
+# Real Tunisian pharmacies
+REAL_PHARMACIES_DATA = [
+    {"name": "Pharmacie Centrale", "address": "Avenue Habib Bourguiba, Tunis, Tunisia", "lat": 36.8065, "lng": 10.1815},
+    {"name": "Pharmacie Ibn Khaldoun", "address": "Rue Ibn Khaldoun, Tunis, Tunisia", "lat": 36.7992, "lng": 10.1704},
+    {"name": "Pharmacie El Medina", "address": "Souk El Medina, Tunis, Tunisia", "lat": 36.7988, "lng": 10.1658},
+    {"name": "Pharmacie Carthage", "address": "Byrsa Hill, Carthage, Tunisia", "lat": 36.8525, "lng": 10.3236},
+    {"name": "Pharmacie Sfax", "address": "Avenue de la République, Sfax, Tunisia", "lat": 34.7406, "lng": 10.7603},
+    {"name": "Pharmacie Sousse", "address": "Boulevard du 14 Janvier, Sousse, Tunisia", "lat": 35.8256, "lng": 10.6369},
+    {"name": "Pharmacie Monastir", "address": "Avenue Farhat Hached, Monastir, Tunisia", "lat": 35.7780, "lng": 10.8262},
+    {"name": "Pharmacie Bizerte", "address": "Rue de la Kasbah, Bizerte, Tunisia", "lat": 37.2744, "lng": 9.8739},
+    {"name": "Pharmacie Nabeul", "address": "Avenue Hedi Chaker, Nabeul, Tunisia", "lat": 36.4561, "lng": 10.7376},
+    {"name": "Pharmacie Hammamet", "address": "Rue de la Médina, Hammamet, Tunisia", "lat": 36.4000, "lng": 10.6167},
+    {"name": "Pharmacie Gabès", "address": "Avenue de la République, Gabès, Tunisia", "lat": 33.8815, "lng": 10.0982},
+    {"name": "Pharmacie Kairouan", "address": "Rue de la Grande Mosquée, Kairouan, Tunisia", "lat": 35.6781, "lng": 10.0963},
+    {"name": "Pharmacie Tozeur", "address": "Avenue Abou El Kacem Chebbi, Tozeur, Tunisia", "lat": 33.9197, "lng": 8.1335},
+    {"name": "Pharmacie Gafsa", "address": "Rue Ali Belhouane, Gafsa, Tunisia", "lat": 34.4250, "lng": 8.7842},
+    {"name": "Pharmacie Ariana", "address": "Avenue de la République, Ariana, Tunisia", "lat": 36.8625, "lng": 10.1956},
+    {"name": "Pharmacie Ben Arous", "address": "Rue de la Révolution, Ben Arous, Tunisia", "lat": 36.7531, "lng": 10.2189},
+    {"name": "Pharmacie Manouba", "address": "Rue de l'Indépendance, Manouba, Tunisia", "lat": 36.8100, "lng": 10.1000},
+    {"name": "Pharmacie Zaghouan", "address": "Rue de la Kasbah, Zaghouan, Tunisia", "lat": 36.4029, "lng": 10.1429},
+    {"name": "Pharmacie Beja", "address": "Rue de la République, Beja, Tunisia", "lat": 36.7256, "lng": 9.1817},
+    {"name": "Pharmacie Mahdia", "address": "Rue du 7 Novembre, Mahdia, Tunisia", "lat": 35.5047, "lng": 11.0622}
+]
+
+
+def clear_database():
+    """Delete all rows, children before parents"""
+    db.session.query(VIPConsultAssignment).delete()
+    db.session.query(VIPConsult).delete()
+    db.session.query(Review).delete()
+    db.session.query(PharmacyStock).delete()
+    db.session.query(Pharmacy).delete()
+    db.session.query(Medicine).delete()
+    db.session.query(Availability).delete()
+    db.session.query(DoctorProfile).delete()
+    db.session.query(User).delete()
+    rebuild_doctor_search()  # Bulk deletes skip the ORM events that keep it in sync
+    db.session.commit()
+
+
 def seed_database():
     app = create_app()
     with app.app_context():
         # Clear existing data (optional, remove if you want to keep existing data)
-        db.session.query(VIPConsultAssignment).delete()
-        db.session.query(VIPConsult).delete()
-        db.session.query(Review).delete()
-        db.session.query(PharmacyStock).delete()
-        db.session.query(Pharmacy).delete()
-        db.session.query(Medicine).delete()
-        db.session.query(Availability).delete()
-        db.session.query(DoctorProfile).delete()
-        db.session.query(User).delete()
-        db.session.commit()
+        clear_database()
 
         # Seed users (patients, doctors, admins, pharmacies)
         users = []
@@ -40,13 +91,12 @@ def seed_database():
         db.session.commit()
 
         # Seed doctor profiles for doctor users
-        specialties = ['Cardiology', 'Dermatology', 'Neurology', 'Pediatrics', 'Orthopedics', 'General Medicine', 'Internal Medicine', 'Gynecology', 'Ophthalmology', 'Dentistry']
         doctors = []
         for user in users:
             if user.role == 'doctor':
                 doctor = DoctorProfile(
                     user_id=user.id,
-                    specialty=random.choice(specialties),
+                    specialty=random.choice(SPECIALTIES),
                     address=fake.address(),
                     phone=fake.phone_number(),
                     bio=fake.text(max_nb_chars=200),
@@ -57,11 +107,9 @@ def seed_database():
         db.session.commit()
 
         # Seed random availability for each doctor
-        days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
         for doctor in doctors:
             num_slots = random.randint(3, 7)  # Random number of availability slots per doctor
-            for _ in range(num_slots):
-                day = random.choice(days)
+            for day in random.sample(DAYS, num_slots):  # One slot per day, so slots never overlap
                 start_hour = random.randint(8, 16)  # Start between 8 AM and 4 PM
                 duration = random.randint(1, 4)  # Duration 1-4 hours
                 end_hour = start_hour + duration
@@ -90,19 +138,7 @@ def seed_database():
         db.session.commit()
 
         # Add common medicines for easier testing
-        common_medicines = [
-            ("Aspirin", "Pain reliever and fever reducer."),
-            ("Ibuprofen", "Anti-inflammatory drug."),
-            ("Paracetamol", "Pain reliever and fever reducer."),
-            ("Amoxicillin", "Antibiotic for bacterial infections."),
-            ("Omeprazole", "Reduces stomach acid."),
-            ("Metformin", "Diabetes medication."),
-            ("Lisinopril", "Blood pressure medication."),
-            ("Simvastatin", "Cholesterol-lowering drug."),
-            ("Levothyroxine", "Thyroid hormone replacement."),
-            ("Albuterol", "Bronchodilator for asthma."),
-        ]
-        for name, desc in common_medicines:
+        for name, desc in COMMON_MEDICINES:
             if not Medicine.query.filter_by(name=name).first():
                 medicine = Medicine(name=name, description=desc)
                 medicines.append(medicine)
@@ -110,33 +146,11 @@ def seed_database():
         db.session.commit()
 
         # Seed pharmacies with real Tunisian data
-        real_pharmacies_data = [
-            {"name": "Pharmacie Centrale", "address": "Avenue Habib Bourguiba, Tunis, Tunisia", "lat": 36.8065, "lng": 10.1815},
-            {"name": "Pharmacie Ibn Khaldoun", "address": "Rue Ibn Khaldoun, Tunis, Tunisia", "lat": 36.7992, "lng": 10.1704},
-            {"name": "Pharmacie El Medina", "address": "Souk El Medina, Tunis, Tunisia", "lat": 36.7988, "lng": 10.1658},
-            {"name": "Pharmacie Carthage", "address": "Byrsa Hill, Carthage, Tunisia", "lat": 36.8525, "lng": 10.3236},
-            {"name": "Pharmacie Sfax", "address": "Avenue de la République, Sfax, Tunisia", "lat": 34.7406, "lng": 10.7603},
-            {"name": "Pharmacie Sousse", "address": "Boulevard du 14 Janvier, Sousse, Tunisia", "lat": 35.8256, "lng": 10.6369},
-            {"name": "Pharmacie Monastir", "address": "Avenue Farhat Hached, Monastir, Tunisia", "lat": 35.7780, "lng": 10.8262},
-            {"name": "Pharmacie Bizerte", "address": "Rue de la Kasbah, Bizerte, Tunisia", "lat": 37.2744, "lng": 9.8739},
-            {"name": "Pharmacie Nabeul", "address": "Avenue Hedi Chaker, Nabeul, Tunisia", "lat": 36.4561, "lng": 10.7376},
-            {"name": "Pharmacie Hammamet", "address": "Rue de la Médina, Hammamet, Tunisia", "lat": 36.4000, "lng": 10.6167},
-            {"name": "Pharmacie Gabès", "address": "Avenue de la République, Gabès, Tunisia", "lat": 33.8815, "lng": 10.0982},
-            {"name": "Pharmacie Kairouan", "address": "Rue de la Grande Mosquée, Kairouan, Tunisia", "lat": 35.6781, "lng": 10.0963},
-            {"name": "Pharmacie Tozeur", "address": "Avenue Abou El Kacem Chebbi, Tozeur, Tunisia", "lat": 33.9197, "lng": 8.1335},
-            {"name": "Pharmacie Gafsa", "address": "Rue Ali Belhouane, Gafsa, Tunisia", "lat": 34.4250, "lng": 8.7842},
-            {"name": "Pharmacie Ariana", "address": "Avenue de la République, Ariana, Tunisia", "lat": 36.8625, "lng": 10.1956},
-            {"name": "Pharmacie Ben Arous", "address": "Rue de la Révolution, Ben Arous, Tunisia", "lat": 36.7531, "lng": 10.2189},
-            {"name": "Pharmacie Manouba", "address": "Rue de l'Indépendance, Manouba, Tunisia", "lat": 36.8100, "lng": 10.1000},
-            {"name": "Pharmacie Zaghouan", "address": "Rue de la Kasbah, Zaghouan, Tunisia", "lat": 36.4029, "lng": 10.1429},
-            {"name": "Pharmacie Beja", "address": "Rue de la République, Beja, Tunisia", "lat": 36.7256, "lng": 9.1817},
-            {"name": "Pharmacie Mahdia", "address": "Rue du 7 Novembre, Mahdia, Tunisia", "lat": 35.5047, "lng": 11.0622}
-        ]
         
         pharmacies = []
         pharmacy_users = [u for u in users if u.role == 'pharmacy']
         for i, user in enumerate(pharmacy_users):
-            data = real_pharmacies_data[i % len(real_pharmacies_data)]
+            data = REAL_PHARMACIES_DATA[i % len(REAL_PHARMACIES_DATA)]
             pharmacy = Pharmacy(
                 name=data["name"],
                 address=data["address"],
@@ -148,7 +162,7 @@ def seed_database():
             db.session.add(pharmacy)
         # Add more pharmacies without users if needed
         for i in range(max(0, 20 - len(pharmacy_users))):
-            data = real_pharmacies_data[(len(pharmacy_users) + i) % len(real_pharmacies_data)]
+            data = REAL_PHARMACIES_DATA[(len(pharmacy_users) + i) % len(REAL_PHARMACIES_DATA)]
             pharmacy = Pharmacy(
                 name=data["name"],
                 address=data["address"],
@@ -197,9 +211,9 @@ def seed_database():
                     db.session.add(review)
         db.session.commit()
 
-        # Update doctor average ratings
-        for doctor in doctors:
-            doctor.update_average_rating()
+        # Rebuild doctor average ratings in one pass
+        recompute_doctor_ratings()
+        db.session.commit()
 
         # Seed VIP consults
         vip_users = [u for u in users if u.is_vip]
@@ -209,7 +223,7 @@ def seed_database():
                 consult = VIPConsult(
                     patient_id=patient.id,
                     description=fake.text(max_nb_chars=200),
-                    specialty=random.choice(specialties),
+                    specialty=random.choice(SPECIALTIES),
                     status=random.choice(['pending', 'accepted', 'completed', 'cancelled'])
                 )
                 db.session.add(consult)
@@ -228,5 +242,179 @@ def seed_database():
 
         print("Database seeded with English data from Tunisia!")
 
+
+# Share of each role among generated users in --scale mode
+SCALE_ROLE_WEIGHTS = {'patient': 86, 'doctor': 8, 'pharmacy': 5, 'admin': 1}
+BATCH_SIZE = 10000
+
+
+def bulk_insert(model, rows, label=None):
+    """Insert an iterable of row dicts in executemany batches and print the rate"""
+    started = perf_counter()
+    count = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == BATCH_SIZE:
+            db.session.execute(model.__table__.insert(), batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        db.session.execute(model.__table__.insert(), batch)
+        count += len(batch)
+    db.session.commit()
+    report_rate(label or model.__tablename__, count, perf_counter() - started)
+    return count
+
+
+def report_rate(label, count, elapsed):
+    print(f'{label:<28}{count:>10} rows {elapsed:8.2f}s {count / elapsed if elapsed else 0:>12,.0f} rows/s')
+
+
+def seed_scaled(scale, app=None):
+    """
+    Generate a load-test sized dataset of `scale` users plus proportional
+    doctors, pharmacies, stocks and reviews. Rows are written with batched
+    Core inserts instead of one ORM object at a time, every user shares one
+    precomputed password hash, uncovered medicines are found with one query,
+    and ratings are aggregated in SQL at the end.
+    """
+    app = app or create_app()
+    with app.app_context():
+        started = perf_counter()
+        clear_database()
+
+        # One PBKDF2 hash for everyone; names come from small pools instead of per-row Faker calls
+        template = User()
+        template.set_password('password123')
+        password_hash = template.password_hash
+        first_names = [fake.first_name() for _ in range(500)]
+        last_names = [fake.last_name() for _ in range(500)]
+        roles = random.choices(list(SCALE_ROLE_WEIGHTS), weights=list(SCALE_ROLE_WEIGHTS.values()), k=scale)
+
+        def users():
+            for i, role in enumerate(roles):
+                is_vip = random.random() < 0.2
+                yield {
+                    'name': f'{random.choice(first_names)} {random.choice(last_names)}',
+                    'email': f'user{i}@medica.test',
+                    'password_hash': password_hash,
+                    'role': role,
+                    'is_vip': is_vip,
+                    'balance': round(random.uniform(0, 1000), 2),
+                    'created_at': datetime.utcnow(),
+                    'vip_plan': random.choice(['basic', 'premium', 'unlimited']) if is_vip else 'none',
+                    'vip_consults_used': 0
+                }
+        bulk_insert(User, users())
+
+        user_ids = {role: db.session.scalars(select(User.id).where(User.role == role)).all() for role in SCALE_ROLE_WEIGHTS}
+        addresses = [fake.address() for _ in range(200)]
+        bios = [fake.text(max_nb_chars=200) for _ in range(200)]
+        bulk_insert(DoctorProfile, ({
+            'user_id': user_id,
+            'specialty': random.choice(SPECIALTIES),
+            'address': random.choice(addresses),
+            'phone': fake.numerify('+216 ## ### ###'),
+            'bio': random.choice(bios),
+            'average_rating': 0.0,
+            'rating_sum': 0,
+            'rating_count': 0
+        } for user_id in user_ids['doctor']))
+        doctor_ids = db.session.scalars(select(DoctorProfile.id)).all()
+
+        def availabilities():
+            for doctor_id in doctor_ids:
+                for day in random.sample(DAYS, random.randint(3, 7)):
+                    start_hour = random.randint(8, 16)
+                    end_hour = min(start_hour + random.randint(1, 4), 18)
+                    yield {'doctor_id': doctor_id, 'day': day,
+                           'start_time': time(start_hour, 0), 'end_time': time(end_hour, 0)}
+        bulk_insert(Availability, availabilities())
+
+        forms = ['Tablet', 'Syrup', 'Injection', 'Cream']
+        words = list({fake.word().capitalize() for _ in range(2000)})
+        descriptions = [fake.text(max_nb_chars=100) for _ in range(200)]
+        medicine_count = max(100, scale // 50)
+        medicines = [{'name': name, 'description': description} for name, description in COMMON_MEDICINES]
+        medicines += ({'name': f'{random.choice(words)} {i} {random.choice(forms)}', 'description': random.choice(descriptions)}
+                      for i in range(medicine_count - len(medicines)))
+        bulk_insert(Medicine, medicines)
+        medicine_ids = db.session.scalars(select(Medicine.id)).all()
+
+        def pharmacies():
+            for n, user_id in enumerate(user_ids['pharmacy']):
+                data = random.choice(REAL_PHARMACIES_DATA)
+                yield {'name': f"{data['name']} {n + 1}", 'address': data['address'], 'user_id': user_id,
+                       'lat': data['lat'] + random.uniform(-0.1, 0.1), 'lng': data['lng'] + random.uniform(-0.1, 0.1)}
+        bulk_insert(Pharmacy, pharmacies())
+        pharmacy_ids = db.session.scalars(select(Pharmacy.id)).all()
+
+        if pharmacy_ids:
+            bulk_insert(PharmacyStock, (
+                {'pharmacy_id': pharmacy_id, 'medicine_id': medicine_id, 'quantity': random.randint(0, 100)}
+                for pharmacy_id in pharmacy_ids
+                for medicine_id in random.sample(medicine_ids, min(len(medicine_ids), random.randint(5, 30)))
+            ))
+
+            # Every medicine is stocked somewhere: one anti-join instead of a probe per medicine
+            stocked = set(db.session.scalars(select(PharmacyStock.medicine_id).distinct()))
+            bulk_insert(PharmacyStock, (
+                {'pharmacy_id': random.choice(pharmacy_ids), 'medicine_id': medicine_id, 'quantity': random.randint(1, 50)}
+                for medicine_id in medicine_ids if medicine_id not in stocked
+            ), label='pharmacy_stocks (coverage)')
+
+        comments = [fake.text(max_nb_chars=150) for _ in range(500)]
+        patient_ids = user_ids['patient']
+        if doctor_ids and patient_ids:
+            bulk_insert(Review, ({
+                'doctor_id': random.choice(doctor_ids),
+                'patient_id': random.choice(patient_ids),
+                'rating': random.randint(1, 5),
+                'comment': random.choice(comments),
+                'created_at': datetime.utcnow()
+            } for _ in range(scale)))
+
+        # Rebuild doctor average ratings in one pass
+        rating_started = perf_counter()
+        recompute_doctor_ratings()
+        db.session.commit()
+        report_rate('doctor ratings (SQL)', len(doctor_ids), perf_counter() - rating_started)
+
+        search_started = perf_counter()
+        rebuild_doctor_search()
+        db.session.commit()
+        report_rate('doctor search documents', len(doctor_ids), perf_counter() - search_started)
+
+        vip_ids = db.session.scalars(select(User.id).where(User.is_vip.is_(True), User.role == 'patient')).all()
+        if vip_ids and doctor_ids:
+            bulk_insert(VIPConsult, ({
+                'patient_id': random.choice(vip_ids),
+                'description': random.choice(descriptions),
+                'specialty': random.choice(SPECIALTIES),
+                'status': random.choice(['pending', 'accepted', 'completed', 'cancelled']),
+                'created_at': datetime.utcnow()
+            } for _ in range(max(10, scale // 1000))))
+            bulk_insert(VIPConsultAssignment, (
+                {'consult_id': consult_id, 'doctor_id': doctor_id,
+                 'status': random.choice(['pending', 'accepted', 'declined']), 'created_at': datetime.utcnow()}
+                for consult_id in db.session.scalars(select(VIPConsult.id)).all()
+                for doctor_id in random.sample(doctor_ids, min(5, len(doctor_ids)))
+            ))
+
+        print(f'Seeded {scale} users in {perf_counter() - started:.1f}s (password for all: password123)')
+
+
 if __name__ == '__main__':
-    seed_database()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Seed the Medica database with sample data')
+    parser.add_argument('--scale', type=int, help='Generate this many users, with proportional doctors, '
+                                                  'pharmacies, stocks and reviews, using bulk inserts')
+    parser.add_argument('--seed', type=int, help='Random seed, for reproducible fixtures')
+    args = parser.parse_args()
+    if args.seed is not None:
+        random.seed(args.seed)
+        Faker.seed(args.seed)
+    if args.scale:
+        seed_scaled(args.scale)
+    else:
+        seed_database()
\ No newline at end of file
@@ -0,0 +1,55 @@
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller (the
+    leader) runs the function, and callers arriving while it is in flight
+    wait for and share its result or exception instead of repeating the
+    work. Nothing is kept once the call finishes; pair it with a short-lived
+    cache to absorb the requests that arrive right after.
+    """
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout  # A follower that waits longer than this computes for itself
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.stats = {'calls': 0, 'shared': 0}
+
+    def do(self, key, function):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.stats['calls'] += 1
+            else:
+                self.stats['shared'] += 1
+
+        if not leader:
+            if not call.done.wait(self.timeout):
+                return function()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function()
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+search_flight = SingleFlight(timeout=10)
@@ -0,0 +1,215 @@
+import atexit
+import json
+import logging
+import re
+import threading
+from datetime import datetime
+from time import monotonic, perf_counter
+from flask import has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger('medica.slowlog')
+
+# Bound parameters whose name suggests personal data are never written to the log
+PII_PARAMETER = re.compile(r'email|name|phone|address|password|comment|description|bio|token|lat|lng', re.IGNORECASE)
+EMAIL = re.compile(r'[^@\s]+@[^@\s]+')
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER = re.compile(r'\?|%\(\w+\)s|%s|:\w+')
+_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_EXPLAINABLE = ('select', 'with', 'update', 'delete')
+
+
+def normalize_statement(statement):
+    """Collapse literals, placeholders and IN lists so equivalent statements group together"""
+    normalized = _STRING_LITERAL.sub('?', statement)
+    normalized = _NUMBER_LITERAL.sub('?', normalized)
+    normalized = _PLACEHOLDER.sub('?', normalized)
+    normalized = _IN_LIST.sub('(...)', normalized)
+    return ' '.join(normalized.split())
+
+
+def redact_parameters(parameters, context):
+    """Bound parameters as a name -> value dict with personal data masked"""
+    named_by_statement = True
+    if isinstance(parameters, dict):
+        named = parameters
+    else:
+        names = getattr(getattr(context, 'compiled', None), 'positiontup', None) or []
+        values = list(parameters or ())
+        if len(names) != len(values):
+            # Expanded IN lists shift positions, so names can't be trusted: mask every string
+            names, named_by_statement = [], False
+        named = {names[i] if names else f'param_{i + 1}': value for i, value in enumerate(values)}
+
+    redacted = {}
+    for name, value in named.items():
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            redacted[name] = f'<{len(value)} bytes>'
+        elif isinstance(value, str) and not named_by_statement:
+            redacted[name] = '<redacted>'
+        elif value is not None and (PII_PARAMETER.search(name) or (isinstance(value, str) and EMAIL.search(value))):
+            redacted[name] = '<redacted>'
+        else:
+            redacted[name] = value if isinstance(value, (int, float, bool, type(None))) else str(value)
+    return redacted
+
+
+class SlowQueryLog:
+    """
+    Times every SQL statement. Statements slower than SLOW_QUERY_THRESHOLD_MS
+    are logged as JSON with their redacted parameters, the calling route and
+    the database's query plan (captured once per normalized statement and
+    summary period). Every SLOW_QUERY_SUMMARY_INTERVAL seconds a summary of
+    the normalized statements ranked by total time is logged and reset.
+    """
+
+    def __init__(self):
+        self.threshold = None
+        self.summary_interval = 300
+        self.summary_size = 10
+        self._stats = {}   # normalized statement -> [count, total ms, max ms, slow count]
+        self._plans = {}   # normalized statement -> plan lines, for this summary period
+        self._period_started = monotonic()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.threshold = app.config['SLOW_QUERY_THRESHOLD_MS']
+        self.summary_interval = app.config['SLOW_QUERY_SUMMARY_INTERVAL']
+        self.summary_size = app.config['SLOW_QUERY_SUMMARY_SIZE']
+        if self.threshold is None:
+            return
+
+        logger.setLevel(logging.INFO)
+        path = app.config['SLOW_QUERY_LOG_FILE']
+        if path and not any(getattr(handler, 'baseFilename', None) == path for handler in logger.handlers):
+            logger.addHandler(logging.FileHandler(path))
+        elif not logger.handlers:
+            logger.addHandler(logging.StreamHandler())
+        atexit.register(self.write_summary)
+
+    @property
+    def enabled(self):
+        return self.threshold is not None
+
+    def record(self, conn, cursor, statement, parameters, context, executemany, elapsed_ms):
+        normalized = normalize_statement(statement)
+        with self._lock:
+            stats = self._stats.setdefault(normalized, [0, 0.0, 0.0, 0])
+            stats[0] += 1
+            stats[1] += elapsed_ms
+            stats[2] = max(stats[2], elapsed_ms)
+            slow = elapsed_ms >= self.threshold
+            if slow:
+                stats[3] += 1
+            summary_due = monotonic() - self._period_started >= self.summary_interval
+
+        if slow:
+            entry = {
+                'event': 'slow_query',
+                'at': datetime.utcnow().isoformat(timespec='milliseconds') + 'Z',
+                'duration_ms': round(elapsed_ms, 3),
+                'route': self._route(),
+                'statement': normalized,  # Literals inlined into the SQL text are not logged
+                'parameters': None if executemany else redact_parameters(parameters, context),
+                'executemany': executemany,
+                'plan': None if executemany else self._plan(conn, statement, parameters, normalized)
+            }
+            logger.warning(json.dumps(entry, default=str))
+        if summary_due:
+            self.write_summary()
+
+    @staticmethod
+    def _route():
+        if not has_request_context():
+            return None
+        return {'endpoint': request.endpoint, 'method': request.method, 'path': request.path}
+
+    def _plan(self, conn, statement, parameters, normalized):
+        """
+        EXPLAIN output, run on a separate cursor so the original result is
+        untouched, inside a savepoint so a failing EXPLAIN cannot abort the
+        caller's transaction (as it would on PostgreSQL)
+        """
+        if normalized in self._plans:
+            return self._plans[normalized]
+        if not statement.lstrip().lower().startswith(_EXPLAINABLE):
+            return None
+
+        dialect = conn.dialect.name
+        if dialect == 'sqlite':
+            explain = 'EXPLAIN QUERY PLAN '
+        elif dialect in ('postgresql', 'mysql', 'mariadb'):
+            explain = 'EXPLAIN '  # Never ANALYZE: that would run the statement again
+        else:
+            return None
+
+        cursor = conn.connection.dbapi_connection.cursor()
+        try:
+            cursor.execute('SAVEPOINT slowlog_explain')
+            try:
+                cursor.execute(explain + statement, parameters)
+                plan = [' '.join(str(column) for column in row) for row in cursor.fetchall()]
+            except Exception as exc:
+                cursor.execute('ROLLBACK TO SAVEPOINT slowlog_explain')
+                plan = [f'EXPLAIN failed: {exc}']
+            cursor.execute('RELEASE SAVEPOINT slowlog_explain')
+        except Exception as exc:
+            # The savepoint itself failed; nothing was explained
+            logger.error('Slow query log could not explain a statement: %s', exc)
+            plan = None
+        finally:
+            cursor.close()
+        self._plans[normalized] = plan
+        return plan
+
+    def write_summary(self):
+        """Log the period's statements ranked by total time, then start a new period"""
+        with self._lock:
+            stats, self._stats, self._plans = self._stats, {}, {}
+            period = monotonic() - self._period_started
+            self._period_started = monotonic()
+        if not stats:
+            return
+
+        ranked = sorted(stats.items(), key=lambda item: item[1][1], reverse=True)[:self.summary_size]
+        logger.info(json.dumps({
+            'event': 'slow_query_summary',
+            'at': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+            'period_seconds': round(period, 1),
+            'statements': len(stats),
+            'top': [{
+                'statement': normalized,
+                'count': count,
+                'total_ms': round(total, 3),
+                'mean_ms': round(total / count, 3),
+                'max_ms': round(maximum, 3),
+                'slow': slow
+            } for normalized, (count, total, maximum, slow) in ranked]
+        }))
+
+
+slow_query_log = SlowQueryLog()
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_timer(conn, cursor, statement, parameters, context, executemany):
+    if slow_query_log.enabled:
+        conn.info.setdefault('slowlog_started', []).append(perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _stop_timer(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('slowlog_started')
+    if started:
+        elapsed_ms = (perf_counter() - started.pop()) * 1000
+        slow_query_log.record(conn, cursor, statement, parameters, context, executemany, elapsed_ms)
+
+
+@event.listens_for(Engine, 'handle_error')
+def _discard_timer(exception_context):
+    connection = exception_context.connection
+    if connection is not None and connection.info.get('slowlog_started'):
+        connection.info['slowlog_started'].pop()
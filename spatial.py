@@ -0,0 +1,172 @@
+import heapq
+import math
+import threading
+import time
+from bisect import bisect_left
+from flask import current_app
+from sqlalchemy import event
+from models import db, Pharmacy
+from distance import EARTH_RADIUS_KM, rank_by_distance
+
+# Rank a candidate set directly while len(candidates)**2 <= this * k * pharmacies: the grid
+# walk visits about k * pharmacies / len(candidates) entries before it has k matches
+DIRECT_RANK_FACTOR = 4
+
+
+def _restricted(predicate, candidates):
+    """predicate, also requiring membership of the sorted sequence candidates"""
+    def restricted(pharmacy_id):
+        position = bisect_left(candidates, pharmacy_id)
+        if position == len(candidates) or candidates[position] != pharmacy_id:
+            return False
+        return predicate is None or predicate(pharmacy_id)
+    return restricted
+
+
+class PharmacyIndex:
+    """
+    In-process grid index over pharmacy coordinates.
+
+    Pharmacies are bucketed into square lat/lng cells. A nearest search walks
+    rings of cells outward from the query point and stops as soon as no
+    unvisited cell can hold anything closer than the k-th result, so its cost
+    depends on k and local density rather than on the number of pharmacies.
+    Searches restricted to a few candidates (say, the pharmacies stocking a
+    rare medicine) rank those directly instead, as the walk would otherwise
+    cover the whole grid looking for k of them.
+    """
+
+    def __init__(self):
+        self.cell_size = None
+        self._cells = {}
+        self._locations = {}  # id -> (lat, lng)
+        self._bounds = None
+        self._built_at = None
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        """Mark the index stale so the next search rebuilds it"""
+        self._built_at = None
+
+    def _cell(self, lat, lng):
+        return (math.floor(lat / self.cell_size), math.floor(lng / self.cell_size))
+
+    def rebuild(self):
+        """Load every pharmacy location from the database into the grid"""
+        self.cell_size = current_app.config['SPATIAL_INDEX_CELL_DEGREES']
+        cells, locations = {}, {}
+        rows = db.session.query(Pharmacy.id, Pharmacy.lat, Pharmacy.lng)
+        for pharmacy_id, lat, lng in rows:
+            cells.setdefault(self._cell(lat, lng), []).append((pharmacy_id, lat, lng))
+            locations[pharmacy_id] = (lat, lng)
+
+        bounds = None
+        if cells:
+            rows_i = [i for i, _ in cells]
+            cols_j = [j for _, j in cells]
+            bounds = (min(rows_i), max(rows_i), min(cols_j), max(cols_j))
+
+        self._cells, self._locations, self._bounds = cells, locations, bounds
+        self._built_at = time.monotonic()
+
+    def _ensure_fresh(self):
+        # Other workers may have changed pharmacies, so rebuild periodically too
+        ttl = current_app.config['SPATIAL_INDEX_TTL']
+        if self._built_at is None or time.monotonic() - self._built_at > ttl:
+            with self._lock:
+                if self._built_at is None or time.monotonic() - self._built_at > ttl:
+                    self.rebuild()
+
+    def _lower_bound(self, lat, ring):
+        """Minimum distance (km) to any point outside the first `ring` rings"""
+        span = math.radians(ring * self.cell_size)
+        lat_bound = EARTH_RADIUS_KM * span
+        # Points beyond the ring in longitude lie within one extra ring in latitude
+        band = min(abs(lat) + (ring + 1) * self.cell_size, 90.0)
+        lng_bound = 2 * EARTH_RADIUS_KM * math.asin(
+            min(1.0, math.cos(math.radians(band)) * math.sin(min(span, math.pi) / 2))
+        )
+        return min(lat_bound, lng_bound)
+
+    def direct_rank_limit(self, k):
+        """Largest candidate set that nearest() ranks directly rather than by walking the grid"""
+        self._ensure_fresh()
+        return math.isqrt(DIRECT_RANK_FACTOR * k * len(self._locations))
+
+    def _rank_candidates(self, lat, lng, candidates, k, predicate):
+        locations = self._locations
+        ids, lats, lngs = [], [], []
+        for pharmacy_id in candidates:
+            location = locations.get(pharmacy_id)  # Missing if deleted since the caller's index was built
+            if location is not None and (predicate is None or predicate(pharmacy_id)):
+                ids.append(pharmacy_id)
+                lats.append(location[0])
+                lngs.append(location[1])
+        return rank_by_distance(lat, lng, ids, lats, lngs, k) if ids else []
+
+    def nearest(self, lat, lng, k=10, predicate=None, candidates=None):
+        """
+        Return up to k (distance_km, pharmacy_id) pairs closest to (lat, lng),
+        nearest first. `predicate`, if given, filters pharmacy IDs;
+        `candidates`, if given, is a sorted sequence of the only IDs to consider.
+        """
+        self._ensure_fresh()
+        cells, bounds = self._cells, self._bounds
+        if not cells or k <= 0:
+            return []
+        if candidates is not None:
+            if len(candidates) <= self.direct_rank_limit(k):
+                return self._rank_candidates(lat, lng, candidates, k, predicate)
+            predicate = _restricted(predicate, candidates)
+
+        ci, cj = self._cell(lat, lng)
+        min_i, max_i, min_j, max_j = bounds
+        max_ring = max(ci - min_i, max_i - ci, cj - min_j, max_j - cj)
+        best = []  # top k so far as (distance_km, pharmacy_id), nearest first
+
+        def visit(entry_lists):
+            ids, lats, lngs = [], [], []
+            for entries in entry_lists:
+                for pharmacy_id, plat, plng in entries:
+                    if predicate is None or predicate(pharmacy_id):
+                        ids.append(pharmacy_id)
+                        lats.append(plat)
+                        lngs.append(plng)
+            if not ids:
+                return best
+            # Distance the whole batch at once and merge it into the running top k
+            ranked = rank_by_distance(lat, lng, ids, lats, lngs, k)
+            return list(heapq.merge(best, ranked))[:k]
+
+        ring = 0
+        while ring <= max_ring:
+            if 8 * ring > len(cells):
+                # Sparse grid: scanning the remaining occupied cells is cheaper
+                best = visit(entries for (i, j), entries in cells.items()
+                             if max(abs(i - ci), abs(j - cj)) >= ring)
+                break
+
+            if ring == 0:
+                ring_cells = [(ci, cj)]
+            else:
+                ring_cells = [(ci - ring, cj + d) for d in range(-ring, ring + 1)]
+                ring_cells += [(ci + ring, cj + d) for d in range(-ring, ring + 1)]
+                ring_cells += [(ci + d, cj - ring) for d in range(-ring + 1, ring)]
+                ring_cells += [(ci + d, cj + ring) for d in range(-ring + 1, ring)]
+            best = visit(cells[cell] for cell in ring_cells if cell in cells)
+
+            if len(best) == k and best[-1][0] <= self._lower_bound(lat, ring):
+                break
+            ring += 1
+
+        return best
+
+
+pharmacy_index = PharmacyIndex()
+
+
+@event.listens_for(Pharmacy, 'after_insert')
+@event.listens_for(Pharmacy, 'after_update')
+@event.listens_for(Pharmacy, 'after_delete')
+def _invalidate_pharmacy_index(mapper, connection, target):
+    pharmacy_index.invalidate()
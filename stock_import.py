@@ -0,0 +1,185 @@
+import csv
+import io
+import json
+from flask import current_app
+from sqlalchemy import insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from models import db, Medicine, PharmacyStock
+from search import medicine_index
+from stock_index import stock_index
+from cache import cache, table_tag
+
+FORMATS = ('csv', 'jsonl')
+MAX_REPORTED_ERRORS = 20
+
+# Dialects with INSERT ... ON CONFLICT; others fall back to separate INSERT/UPDATE batches
+_UPSERT_INSERTS = {'sqlite': sqlite.insert, 'postgresql': postgresql.insert}
+
+
+def detect_format(filename=None, content_type=None):
+    """Guess the stock file format from its extension or content type"""
+    extension = (filename or '').rsplit('.', 1)[-1].lower()
+    if extension == 'csv' or 'csv' in (content_type or ''):
+        return 'csv'
+    if extension in ('jsonl', 'ndjson') or 'ndjson' in (content_type or '') or 'jsonl' in (content_type or ''):
+        return 'jsonl'
+    return None
+
+
+def parse_csv(stream):
+    """Yield (line number, record) from a CSV file with a header row"""
+    reader = csv.DictReader(stream)
+    fields = set(reader.fieldnames or ())
+    if not ({'medicine_name', 'name'} & fields and 'quantity' in fields):
+        raise ValueError('CSV needs a header with medicine_name (or name) and quantity columns')
+    for record in reader:
+        yield reader.line_num, record
+
+
+def parse_jsonl(stream):
+    """Yield (line number, record) from a JSON-lines file, skipping blank lines"""
+    for line_num, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            yield line_num, json.loads(line)
+        except ValueError:
+            yield line_num, None
+
+
+PARSERS = {'csv': parse_csv, 'jsonl': parse_jsonl}
+
+
+def _clean(record):
+    """Validated (medicine name, quantity) from a parsed record; raises ValueError"""
+    if not isinstance(record, dict):
+        raise ValueError('Expected a JSON object')
+    name = str(record.get('medicine_name') or record.get('name') or '').strip()
+    if not name or len(name) > 200:
+        raise ValueError('Medicine name must be 1-200 characters')
+    try:
+        quantity = int(str(record.get('quantity')).strip())
+    except ValueError:
+        raise ValueError('Quantity must be an integer') from None
+    if quantity < 0:
+        raise ValueError('Quantity must not be negative')
+    return name, quantity
+
+
+def _resolve_medicines(names, created):
+    """Map names to medicine ids, creating missing medicines in one batch"""
+    ids = {name: medicine_id for medicine_id, name in db.session.execute(
+        select(Medicine.id, Medicine.name).where(Medicine.name.in_(names)))}
+    missing = [name for name in names if name not in ids]
+    if missing:
+        dialect_insert = _UPSERT_INSERTS.get(db.engine.dialect.name)
+        if dialect_insert:
+            statement = dialect_insert(Medicine).on_conflict_do_nothing(index_elements=['name'])
+        else:
+            statement = insert(Medicine)
+        db.session.execute(statement, [{'name': name, 'description': 'Added by pharmacy'} for name in missing])
+        for medicine_id, name in db.session.execute(
+                select(Medicine.id, Medicine.name).where(Medicine.name.in_(missing))):
+            ids[name] = medicine_id
+            created[medicine_id] = name
+    return ids
+
+
+def _upsert_stock(new_rows, changed_rows):
+    dialect_insert = _UPSERT_INSERTS.get(db.engine.dialect.name)
+    if dialect_insert:
+        statement = dialect_insert(PharmacyStock)
+        statement = statement.on_conflict_do_update(
+            index_elements=['pharmacy_id', 'medicine_id'],
+            set_={'quantity': statement.excluded.quantity}
+        )
+        db.session.execute(statement, new_rows + changed_rows)
+        return
+    if new_rows:
+        db.session.execute(insert(PharmacyStock), new_rows)
+    if changed_rows:
+        db.session.execute(update(PharmacyStock), changed_rows)
+
+
+def _apply_chunk(pharmacy_id, quantities, report, created, stocked):
+    """Upsert one chunk ({medicine name: quantity}) and commit it"""
+    chunk_created = {}
+    medicine_ids = _resolve_medicines(list(quantities), chunk_created)
+    wanted = {medicine_ids[name]: quantity for name, quantity in quantities.items()}
+    existing = dict(db.session.execute(
+        select(PharmacyStock.medicine_id, PharmacyStock.quantity).where(
+            PharmacyStock.pharmacy_id == pharmacy_id,
+            PharmacyStock.medicine_id.in_(list(wanted))
+        )
+    ).all())
+
+    new_rows, changed_rows = [], []
+    for medicine_id, quantity in wanted.items():
+        row = {'pharmacy_id': pharmacy_id, 'medicine_id': medicine_id, 'quantity': quantity}
+        if medicine_id not in existing:
+            new_rows.append(row)
+        elif existing[medicine_id] != quantity:
+            changed_rows.append(row)
+    if new_rows or changed_rows:
+        _upsert_stock(new_rows, changed_rows)
+    db.session.commit()
+    created.update(chunk_created)
+    stocked.update(((row['medicine_id'], pharmacy_id), row['quantity'] > 0) for row in new_rows + changed_rows)
+
+    report['inserted'] += len(new_rows)
+    report['updated'] += len(changed_rows)
+    report['unchanged'] += len(wanted) - len(new_rows) - len(changed_rows)
+
+
+def import_stock(pharmacy_id, stream, fmt, chunk_size=None):
+    """
+    Upsert a pharmacy's stock from a CSV or JSON-lines text stream.
+
+    Rows need a medicine name (`medicine_name` or `name`) and a `quantity`;
+    unknown medicines are created. The file is parsed lazily and written in
+    transactions of STOCK_IMPORT_CHUNK_SIZE rows, so chunks committed before a
+    fatal error (e.g. undecodable bytes) are kept. Invalid rows are skipped and
+    counted as rejected. Returns a report of inserted/updated/unchanged counts.
+    """
+    chunk_size = chunk_size or current_app.config['STOCK_IMPORT_CHUNK_SIZE']
+    report = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'rejected': 0,
+              'medicines_created': 0, 'errors': []}
+    created = {}  # id -> name of medicines added by this import
+    stocked = {}  # (medicine id, pharmacy id) -> in stock, for committed rows
+    chunk = {}
+    line_num = 0
+
+    try:
+        for line_num, record in PARSERS[fmt](stream):
+            try:
+                name, quantity = _clean(record)
+            except ValueError as exc:
+                report['rejected'] += 1
+                if len(report['errors']) < MAX_REPORTED_ERRORS:
+                    report['errors'].append({'line': line_num, 'error': str(exc)})
+                continue
+            chunk[name] = quantity  # Last occurrence wins
+            if len(chunk) >= chunk_size:
+                _apply_chunk(pharmacy_id, chunk, report, created, stocked)
+                chunk = {}
+        if chunk:
+            _apply_chunk(pharmacy_id, chunk, report, created, stocked)
+    except (ValueError, csv.Error) as exc:
+        db.session.rollback()
+        report['error'] = f'Import stopped after {line_num} lines: {exc}'
+    finally:
+        # Core bulk statements bypass the ORM events that keep these in sync
+        if created:
+            medicine_index.apply(created, set())
+        if stocked:
+            stock_index.apply(stocked)
+        if report['inserted'] or report['updated'] or created:
+            cache.invalidate(table_tag(PharmacyStock), table_tag(Medicine))
+
+    report['medicines_created'] = len(created)
+    return report
+
+
+def open_text(binary_stream):
+    """Decode an uploaded byte stream as UTF-8 (BOM tolerated) without reading it all"""
+    return io.TextIOWrapper(binary_stream, encoding='utf-8-sig', newline='')
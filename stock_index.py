@@ -0,0 +1,190 @@
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from flask import current_app
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+from models import db, PharmacyStock
+from spatial import pharmacy_index
+
+PARTIAL_CANDIDATES_PER_RESULT = 5
+
+
+def _contains(postings, pharmacy_id):
+    position = bisect_left(postings, pharmacy_id)
+    return position < len(postings) and postings[position] == pharmacy_id
+
+
+def intersect(posting_lists):
+    """Sorted ids present in every sorted posting list, walking the shortest one"""
+    if not posting_lists:
+        return []
+    shortest, *others = sorted(posting_lists, key=len)
+    others.sort(key=len)  # The smallest lists reject the most candidates soonest
+    return [pharmacy_id for pharmacy_id in shortest
+            if all(_contains(postings, pharmacy_id) for postings in others)]
+
+
+class StockIndex:
+    """
+    In-memory inverted index from medicine id to the sorted ids of the
+    pharmacies holding it in stock (quantity > 0).
+
+    Posting lists are compact int arrays, so "who stocks all of these"
+    intersects the shortest list against binary searches in the others
+    instead of rescanning pharmacy_stocks. Committed stock changes are applied
+    incrementally; a periodic in-stock count/id-sum comparison triggers a
+    rebuild when another worker has changed stock.
+    """
+
+    def __init__(self):
+        self._postings = {}   # medicine id -> sorted array of pharmacy ids
+        self._signature_at_build = None
+        self._built_at = None
+        self._lock = threading.RLock()
+
+    def invalidate(self):
+        """Mark the index stale so the next lookup rebuilds it"""
+        self._built_at = None
+
+    def _signature(self):
+        return tuple(db.session.query(
+            func.count(),
+            func.coalesce(func.sum(PharmacyStock.pharmacy_id), 0),
+            func.coalesce(func.sum(PharmacyStock.medicine_id), 0)
+        ).select_from(PharmacyStock).filter(PharmacyStock.quantity > 0).one())
+
+    def rebuild(self):
+        """Load every in-stock (medicine, pharmacy) pair, already in posting order"""
+        signature = self._signature()
+        rows = db.session.query(PharmacyStock.medicine_id, PharmacyStock.pharmacy_id).filter(
+            PharmacyStock.quantity > 0
+        ).order_by(PharmacyStock.medicine_id, PharmacyStock.pharmacy_id)
+        postings = {}
+        for medicine_id, pharmacy_id in rows:
+            entries = postings.get(medicine_id)
+            if entries is None:
+                entries = postings[medicine_id] = array('i')
+            entries.append(pharmacy_id)
+        with self._lock:
+            self._postings = postings
+            self._signature_at_build = signature
+            self._built_at = time.monotonic()
+
+    def _ensure_fresh(self):
+        ttl = current_app.config['STOCK_INDEX_TTL']
+        if self._built_at is not None and time.monotonic() - self._built_at <= ttl:
+            return
+        with self._lock:
+            if self._built_at is None:
+                self.rebuild()
+            elif time.monotonic() - self._built_at > ttl:
+                if self._signature() != self._signature_at_build:
+                    self.rebuild()
+                else:
+                    self._built_at = time.monotonic()
+
+    def apply(self, changes):
+        """Apply committed changes: {(medicine_id, pharmacy_id): in stock?}"""
+        if self._built_at is None:
+            return  # Not built yet; the first lookup loads everything
+        with self._lock:
+            for (medicine_id, pharmacy_id), in_stock in changes.items():
+                postings = self._postings.get(medicine_id)
+                if postings is None:
+                    if not in_stock:
+                        continue
+                    postings = self._postings[medicine_id] = array('i')
+                position = bisect_left(postings, pharmacy_id)
+                present = position < len(postings) and postings[position] == pharmacy_id
+                if in_stock and not present:
+                    postings.insert(position, pharmacy_id)
+                elif present and not in_stock:
+                    del postings[position]
+
+    def pharmacies(self, medicine_id):
+        """Sorted ids of the pharmacies that have the medicine in stock"""
+        self._ensure_fresh()
+        return self._postings.get(medicine_id, array('i'))
+
+    def coverage(self, medicine_ids):
+        """
+        (all, covers) for a basket: the sorted ids stocking every medicine, and
+        a function counting how many of the medicines a pharmacy stocks
+        """
+        self._ensure_fresh()
+        with self._lock:
+            posting_lists = [self._postings.get(medicine_id, array('i')) for medicine_id in medicine_ids]
+            # A single list is its own intersection; no need to copy one that may hold every pharmacy
+            complete = posting_lists[0] if len(posting_lists) == 1 else intersect(posting_lists)
+
+        def covers(pharmacy_id):
+            return sum(_contains(postings, pharmacy_id) for postings in posting_lists)
+        return complete, covers
+
+    def stocking_any(self, medicine_ids, limit):
+        """
+        Sorted ids of the pharmacies stocking at least one of the medicines, or
+        None when the posting lists hold more than `limit` entries between them
+        """
+        self._ensure_fresh()
+        with self._lock:
+            posting_lists = [self._postings.get(medicine_id, array('i')) for medicine_id in medicine_ids]
+            if sum(map(len, posting_lists)) > limit:
+                return None
+            return sorted(set().union(*posting_lists))
+
+
+stock_index = StockIndex()
+
+
+def find_basket(medicine_ids, lat, lng, k=10):
+    """
+    Up to k (distance_km, pharmacy_id, medicines covered) for a basket of
+    medicines: the nearest pharmacies stocking all of them first, then, if
+    there are fewer than k of those, the nearby pharmacies covering the most
+    of the basket (ranked by coverage, then distance).
+    """
+    complete, covers = stock_index.coverage(medicine_ids)
+    results = [(distance, pharmacy_id, len(medicine_ids)) for distance, pharmacy_id in
+               pharmacy_index.nearest(lat, lng, k=k, candidates=complete)]
+    if len(results) < k and len(medicine_ids) > 1:
+        found = {pharmacy_id for _, pharmacy_id, _ in results}
+        coverage = {}
+        wanted = (k - len(results)) * PARTIAL_CANDIDATES_PER_RESULT
+        # Few pharmacies stock any of the basket: rank those directly rather than walk the whole grid
+        candidates = stock_index.stocking_any(medicine_ids, pharmacy_index.direct_rank_limit(wanted))
+
+        def partial(pharmacy_id):
+            if pharmacy_id in found:
+                return False
+            coverage[pharmacy_id] = covers(pharmacy_id)
+            return coverage[pharmacy_id] > 0
+        nearby = pharmacy_index.nearest(lat, lng, k=wanted, predicate=partial, candidates=candidates)
+        ranked = sorted(nearby, key=lambda candidate: (-coverage[candidate[1]], candidate[0]))
+        results += [(distance, pharmacy_id, coverage[pharmacy_id]) for distance, pharmacy_id in ranked[:k - len(results)]]
+    return results
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_stock_changes(session, flush_context):
+    changes = session.info.setdefault('stock_index_changes', {})
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, PharmacyStock):
+            changes[(obj.medicine_id, obj.pharmacy_id)] = (obj.quantity or 0) > 0
+    for obj in session.deleted:
+        if isinstance(obj, PharmacyStock):
+            changes[(obj.medicine_id, obj.pharmacy_id)] = False
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_stock_changes(session):
+    changes = session.info.pop('stock_index_changes', None)
+    if changes:
+        stock_index.apply(changes)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_stock_changes(session):
+    session.info.pop('stock_index_changes', None)
@@ -0,0 +1,180 @@
+import hashlib
+import mimetypes
+import os
+import shutil
+import tempfile
+from collections import namedtuple
+from flask import Request, current_app, send_file
+from werkzeug.utils import secure_filename
+
+CHUNK_SIZE = 64 * 1024
+
+StoredFile = namedtuple('StoredFile', 'key sha256 size created')
+
+
+class LocalBackend:
+    """
+    Content-addressed blobs in a local directory, sharded by the first hex
+    digits of their hash (ab/cd/abcd....pdf) to keep directories small.
+    Temporary files live under the same root so commits are atomic renames.
+
+    A backend provides temp_file(), commit(temp_path, key), discard(temp_path),
+    exists(key), open(key) and path(key) (None when blobs are not local files).
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.tmp_dir = os.path.join(root, 'tmp')
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.root, *key.split('/'))
+
+    def temp_file(self):
+        """A new writable binary file and its path"""
+        fd, temp_path = tempfile.mkstemp(dir=self.tmp_dir)
+        return os.fdopen(fd, 'w+b'), temp_path
+
+    def commit(self, temp_path, key):
+        """Move a finished temp file to key; returns False if the blob already existed"""
+        destination = self.path(key)
+        if os.path.exists(destination):
+            os.remove(temp_path)
+            return False
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        os.replace(temp_path, destination)
+        return True
+
+    def discard(self, temp_path):
+        try:
+            os.remove(temp_path)
+        except FileNotFoundError:
+            pass
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    def open(self, key):
+        return open(self.path(key), 'rb')
+
+
+BACKENDS = {
+    'local': lambda app: LocalBackend(app.config['UPLOAD_STORAGE_DIR'])
+}
+
+
+class HashingFile:
+    """Backend temp file that hashes and counts every byte written to it"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._file, self.temp_path = backend.temp_file()
+        self._hash = hashlib.sha256()
+        self.size = 0
+        self.committed = False
+
+    def write(self, data):
+        self._hash.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+    def commit(self, key):
+        """Hand the finished file to the backend under key; returns whether it was new"""
+        self._file.close()
+        created = self.backend.commit(self.temp_path, key)
+        self.committed = True
+        return created
+
+    def close(self):
+        self._file.close()
+        if not self.committed:
+            self.backend.discard(self.temp_path)
+
+    def __getattr__(self, name):
+        # read/seek/flush/... go to the underlying file, so it still works as an upload stream
+        return getattr(self._file, name)
+
+
+class Storage:
+    """Streams uploads to the configured backend (UPLOAD_STORAGE_BACKEND) and deduplicates them by SHA-256"""
+
+    def __init__(self):
+        self.backend = None
+
+    def init_app(self, app):
+        self.backend = BACKENDS[app.config['UPLOAD_STORAGE_BACKEND']](app)
+        app.request_class = StreamingUploadRequest
+
+    def temp_stream(self):
+        return HashingFile(self.backend)
+
+    @staticmethod
+    def key_for(sha256, filename):
+        name = secure_filename(filename or '')
+        extension = name.rpartition('.')[2].lower() if '.' in name else ''
+        return f"{sha256[:2]}/{sha256[2:4]}/{sha256}{'.' + extension if extension else ''}"
+
+    def save(self, upload):
+        """
+        Store a werkzeug FileStorage and return a StoredFile. Uploads parsed by
+        StreamingUploadRequest were already hashed on their way to disk; any
+        other stream is copied in CHUNK_SIZE pieces, so memory use stays flat.
+        """
+        stream = upload.stream
+        if not isinstance(stream, HashingFile) or stream.backend is not self.backend:
+            stream = self.temp_stream()
+            try:
+                shutil.copyfileobj(upload.stream, stream, CHUNK_SIZE)
+            except BaseException:
+                stream.close()
+                raise
+
+        key = self.key_for(stream.hexdigest(), upload.filename)
+        created = stream.commit(key)
+        return StoredFile(key, stream.hexdigest(), stream.size, created)
+
+    def path(self, key):
+        return self.backend.path(key)
+
+    def open(self, key):
+        return self.backend.open(key)
+
+    def send(self, key, download_name=None):
+        """
+        Response for a stored blob. With UPLOAD_SENDFILE set, the body is left
+        to the front-end server (an X-Sendfile path, or an X-Accel-Redirect to
+        UPLOAD_ACCEL_REDIRECT_PREFIX + key for nginx); otherwise it is streamed with
+        conditional GET and Range support. Keys never change content, so the
+        digest is a strong ETag and the response may be cached privately.
+        """
+        mode = current_app.config['UPLOAD_SENDFILE']
+        if mode == 'x-accel-redirect':
+            response = current_app.response_class(
+                mimetype=mimetypes.guess_type(download_name or key)[0] or 'application/octet-stream')
+            response.headers['X-Accel-Redirect'] = current_app.config['UPLOAD_ACCEL_REDIRECT_PREFIX'] + key
+            if download_name:
+                response.headers.set('Content-Disposition', 'inline', filename=download_name)
+        else:
+            response = send_file(  # Sets X-Sendfile instead of a body when USE_X_SENDFILE is on
+                self.path(key),
+                download_name=download_name,
+                conditional=True,
+                etag=key.rpartition('/')[2].partition('.')[0],
+                max_age=current_app.config['UPLOAD_CACHE_MAX_AGE']
+            )
+        response.cache_control.public = False
+        response.cache_control.private = True
+        return response
+
+
+storage = Storage()
+
+
+class StreamingUploadRequest(Request):
+    """Request whose multipart file parts are written straight into the storage backend while hashing"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return storage.temp_stream()